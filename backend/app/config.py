@@ -6,6 +6,7 @@ class Settings(BaseSettings):
     SECRET_KEYS: List[str] = ["super-secret-key"]  # put primary key first; rotate by adding new keys
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60*24*7
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
     DATABASE_URL: str = "sqlite:///./db.sqlite"
     CORS_ORIGINS: List[str] = ["http://localhost:5173"]
     REDIS_URL: Optional[str] = None
@@ -20,6 +21,38 @@ class Settings(BaseSettings):
     AWS_ACCESS_KEY_ID: Optional[str] = None
     AWS_SECRET_ACCESS_KEY: Optional[str] = None
     MODELS_DIR: str = "./models"
+    TICKET_SNAPSHOT_MAX_SAMPLES: int = 600  # ~10 minutes of 1 Hz telemetry per ticket
+    AUTO_TICKET_SCORE_THRESHOLD: Optional[float] = -0.6  # IsolationForest score below which a ticket opens; None disables
+    AUTO_TICKET_CONTEXT_SAMPLES: int = 180  # recent samples per vehicle attached to an auto ticket
+    AUTO_TICKET_FLUSH_SECONDS: float = 5.0
+    AUTO_TICKET_FLEET_EVENT_VEHICLES: int = 25  # more new incidents than this in one flush become one fleet-wide ticket
+    AUTO_TICKET_FLEET_EVENT_WINDOW_SECONDS: float = 60.0  # incidents join an open fleet ticket only this soon after its last anomaly
+    AUTO_TICKET_IDLE_SECONDS: float = 900.0  # drop context buffers for vehicles not heard from in this long
+    DTC_BUCKET_SECONDS: int = 300
+    DTC_RETENTION_SECONDS: int = 60*60*24
+    DTC_SKETCH_WIDTH: int = 1024
+    DTC_SKETCH_DEPTH: int = 4
+    DTC_TOPK_CAPACITY: int = 64  # heavy-hitter candidates kept per bucket
+    DTC_SYNC_SECONDS: float = 1.0  # how often each worker adds its DTC counts to Redis, when REDIS_URL is set
+    LIVE_FEED_QUEUE_SIZE: int = 100  # pending events per websocket subscriber before dropping
+    LIVE_FEED_OUTBOUND_SIZE: int = 10000
+    LIVE_FEED_TICK_SECONDS: float = 0.1  # events are coalesced by key and fanned out once per tick
+    LIVE_FEED_KEY_INTERVAL_SECONDS: float = 5.0  # each vehicle/ticket is sent at most this often, newest event wins
+    LOAD_SHED_ENABLED: bool = True
+    LOAD_SHED_CLASSES: List[str] = ["telemetry"]  # route classes that may be rejected with 503 under load
+    LOAD_SHED_PASSIVE_CLASSES: List[str] = ["metrics", "training"]  # route classes whose latency never triggers shedding
+    LOAD_SHED_BACK_OFF_SECONDS: float = 1.0  # sheddable limits back off at most once per this interval
+    LOAD_SHED_INITIAL_LIMIT: int = 32
+    LOAD_SHED_MIN_LIMIT: int = 4
+    LOAD_SHED_MAX_LIMIT: int = 512
+    LOAD_SHED_RETRY_AFTER_SECONDS: int = 1
+    INFERENCE_MAX_BATCH: int = 256
+    INFERENCE_MAX_WAIT_MS: float = 5.0  # longest a request waits for others to batch with
+    PROFILING_ENABLED: bool = True  # per-request phase timing and captures; False installs nothing
+    PROFILE_SAMPLE_RATE: float = 0.0  # fraction of requests profiled without an admin X-Profile header
+    PROFILE_SLOW_REQUEST_MS: float = 1000.0  # requests at least this slow are captured with a phase breakdown
+    PROFILE_DIR: str = "./profiles"
+    PROFILE_MAX_CAPTURES: int = 200
     class Config:
         env_file = '.env'
 settings = Settings()
\ No newline at end of file
@@ -1,4 +1,8 @@
-from sqlalchemy.orm import Session
+import base64, binascii
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, joinedload
 from . import models, security
 from .schemas import UserCreate
 
@@ -11,4 +15,49 @@ def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username==username).first()
 
 def list_technicians(db: Session):
-    return db.query(models.User).filter(models.User.role=='technician').all()
\ No newline at end of file
+    return db.query(models.User).filter(models.User.role=='technician').all()
+
+def encode_ticket_cursor(ticket: models.Ticket) -> str:
+    raw = f"{ticket.created_at.isoformat()}|{ticket.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_ticket_cursor(cursor: str):
+    """Returns (created_at, id) for a cursor; raises ValueError if it is malformed."""
+    try:
+        created_at, ticket_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(ticket_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+def list_tickets(db: Session, status: Optional[str] = None, priority: Optional[str] = None,
+                 assigned_to: Optional[int] = None, vehicle_id: Optional[str] = None,
+                 created_after: Optional[datetime] = None, created_before: Optional[datetime] = None,
+                 cursor: Optional[str] = None, limit: int = 50):
+    """
+    Lists tickets newest first using keyset pagination on (created_at, id).
+    Returns the page of tickets and the cursor for the next page (None on the last page).
+    """
+    q = db.query(models.Ticket).options(
+        joinedload(models.Ticket.assigned_user).load_only(models.User.id, models.User.username),
+    )
+    if status is not None:
+        q = q.filter(models.Ticket.status == status)
+    if priority is not None:
+        q = q.filter(models.Ticket.priority == priority)
+    if assigned_to is not None:
+        q = q.filter(models.Ticket.assigned_to == assigned_to)
+    if vehicle_id is not None:
+        q = q.filter(models.Ticket.vehicle_id == vehicle_id)
+    if created_after is not None:
+        q = q.filter(models.Ticket.created_at >= created_after)
+    if created_before is not None:
+        q = q.filter(models.Ticket.created_at < created_before)
+    if cursor is not None:
+        q = q.filter(tuple_(models.Ticket.created_at, models.Ticket.id) < tuple_(*decode_ticket_cursor(cursor)))
+
+    rows = q.order_by(models.Ticket.created_at.desc(), models.Ticket.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_ticket_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def get_ticket_snapshot(db: Session, ticket_id: int):
+    return db.query(models.TicketSnapshot).filter(models.TicketSnapshot.ticket_id == ticket_id).first()
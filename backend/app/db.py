@@ -6,4 +6,11 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 def init_db():
     from . import models
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+def get_db():
+    """FastAPI dependency that provides and properly closes a database session."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
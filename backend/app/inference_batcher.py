@@ -0,0 +1,86 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .config import settings
+from .logging_config import logger
+
+
+class InferenceBatcher:
+    """
+    Coalesces concurrent single-sample inference calls into one vectorised call.
+
+    Requests queue up while a batch is running and go out together as soon as
+    it finishes. When the model is idle a request waits at most `wait_ms`
+    for company, or goes at once if `batch_size` rows are already queued.
+    Both adapt to load: batches that fill up double `batch_size` (up to
+    `max_batch`), timer flushes that catch a single request halve `wait_ms`
+    so light traffic is not delayed, and timer flushes that do find company
+    let it grow again towards `max_wait_ms`.
+    """
+
+    def __init__(self, model, max_batch: int = settings.INFERENCE_MAX_BATCH,
+                 max_wait_ms: float = settings.INFERENCE_MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.batch_size = min(8, max_batch)
+        self.wait_ms = max_wait_ms
+        self._queue: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running = False
+        self.batches = 0
+        self.rows = 0
+
+    async def submit(self, feat: np.ndarray) -> Tuple[float, int]:
+        """Returns (score, label) for one feature vector."""
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.append((feat, fut))
+        if not self._running:
+            if len(self._queue) >= self.batch_size:
+                self._flush(by_timer=False)
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.wait_ms / 1000, self._flush, True)
+        return await fut
+
+    def _flush(self, by_timer: bool):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._running or not self._queue:
+            return
+        batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+        self._adapt(len(batch), by_timer)
+        self._running = True
+        asyncio.get_running_loop().create_task(self._run(batch))
+
+    def _adapt(self, n: int, by_timer: bool):
+        if not by_timer:
+            if n >= self.batch_size:
+                self.batch_size = min(self.max_batch, self.batch_size * 2)
+        elif n == 1:
+            self.wait_ms = self.wait_ms / 2
+            self.batch_size = max(1, self.batch_size // 2)
+        else:
+            self.wait_ms = min(self.max_wait_ms, max(self.wait_ms * 1.5, 0.1))
+
+    async def _run(self, batch):
+        try:
+            feats = np.vstack([feat for feat, _ in batch])
+            scores, labels = await asyncio.get_running_loop().run_in_executor(None, self.model.score_and_predict, feats)
+            for (_, fut), score, label in zip(batch, scores.tolist(), labels.tolist()):
+                if not fut.done():
+                    fut.set_result((score, label))
+            self.batches += 1
+            self.rows += len(batch)
+        except Exception as e:
+            logger.error("Batched inference failed", exc_info=True)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        finally:
+            self._running = False
+            # Whatever queued up while this batch ran goes out immediately.
+            if self._queue:
+                self._flush(by_timer=False)
@@ -0,0 +1,190 @@
+import json
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import settings
+
+# First matching prefix wins; anything unmatched is 'default'.
+ROUTE_CLASSES: List[Tuple[str, str]] = [
+    ('/telemetry', 'telemetry'),
+    ('/dtc', 'analytics'),
+    ('/auth', 'auth'),
+    ('/tickets', 'tickets'),
+    ('/users', 'auth'),
+    ('/train', 'training'),
+    ('/live', 'admin'),
+    ('/metrics', 'metrics'),
+    ('/admin', 'admin'),
+]
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit that follows latency, in the style of a gradient limiter.
+
+    A short and a long exponential average of request latency are kept, with
+    weights `short_smoothing` and `long_smoothing`. When recent latency rises
+    above the long-run baseline the limit shrinks in proportion; while
+    latency holds steady it grows by roughly sqrt(limit) per sample, but only
+    if the current limit is actually being used. `smoothing` damps those
+    limit changes.
+    """
+
+    def __init__(self, initial: float, min_limit: float, max_limit: float,
+                 tolerance: float = 1.5, smoothing: float = 0.2,
+                 short_smoothing: float = 0.2, long_smoothing: float = 0.01):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.short_smoothing = short_smoothing
+        self.long_smoothing = long_smoothing
+        self.in_flight = 0
+        self.short_rtt: Optional[float] = None
+        self.long_rtt: Optional[float] = None
+        self.shed = 0
+
+    @property
+    def degraded(self) -> bool:
+        return self.short_rtt is not None and self.short_rtt > self.tolerance * self.long_rtt
+
+    def on_sample(self, rtt: float, in_flight: int):
+        if self.short_rtt is None:
+            self.short_rtt = self.long_rtt = rtt
+            return
+        self.short_rtt += self.short_smoothing * (rtt - self.short_rtt)
+        self.long_rtt += self.long_smoothing * (rtt - self.long_rtt)
+        # Let the baseline recover quickly once a slow period is over.
+        if self.long_rtt > self.short_rtt * 2:
+            self.long_rtt *= 0.95
+        if in_flight < self.limit / 2 and not self.degraded:
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        self._set((1 - self.smoothing) * self.limit + self.smoothing * target)
+
+    def back_off(self, factor: float = 0.9):
+        self._set(self.limit * factor)
+
+    def _set(self, value: float):
+        self.limit = max(self.min_limit, min(self.max_limit, value))
+
+
+class ConcurrencyLimiter:
+    """
+    Per-route-class concurrency limits for this worker.
+
+    Every class has an adaptive limit and reports it, but only `sheddable`
+    classes are ever rejected. Sheddable classes are also backed off when a
+    protected class (auth, tickets, admin, ...) shows rising latency while at
+    least `pressure` of its own limit is in flight, so a telemetry surge gives
+    way before it slows the routes that matter. That happens at most once per
+    `back_off_seconds`. A lone slow request is not pressure, and `passive`
+    classes such as metrics scrapes and training jobs never trigger it.
+    """
+
+    def __init__(self, route_classes: Iterable[Tuple[str, str]] = ROUTE_CLASSES,
+                 sheddable: Iterable[str] = settings.LOAD_SHED_CLASSES,
+                 initial: float = settings.LOAD_SHED_INITIAL_LIMIT,
+                 min_limit: float = settings.LOAD_SHED_MIN_LIMIT,
+                 max_limit: float = settings.LOAD_SHED_MAX_LIMIT,
+                 passive: Iterable[str] = settings.LOAD_SHED_PASSIVE_CLASSES,
+                 back_off_seconds: float = settings.LOAD_SHED_BACK_OFF_SECONDS,
+                 pressure: float = 0.75, clock=time.monotonic):
+        self.route_classes = list(route_classes)
+        self.sheddable = set(sheddable)
+        self.passive = set(passive)
+        self.back_off_seconds = back_off_seconds
+        self.pressure = pressure
+        self.clock = clock
+        self._last_back_off: Optional[float] = None
+        self.limits: Dict[str, AdaptiveLimit] = {
+            name: AdaptiveLimit(initial, min_limit, max_limit)
+            for name in {c for _, c in self.route_classes} | {'default'}
+        }
+
+    def classify(self, path: str) -> str:
+        for prefix, name in self.route_classes:
+            if path.startswith(prefix):
+                return name
+        return 'default'
+
+    def try_acquire(self, name: str) -> bool:
+        limit = self.limits[name]
+        if name in self.sheddable and limit.in_flight >= limit.limit:
+            limit.shed += 1
+            return False
+        limit.in_flight += 1
+        return True
+
+    def release(self, name: str, rtt: float):
+        limit = self.limits[name]
+        in_flight = limit.in_flight
+        limit.in_flight -= 1
+        limit.on_sample(rtt, in_flight)
+        if name in self.sheddable or name in self.passive:
+            return
+        if limit.degraded and in_flight >= self.pressure * limit.limit:
+            now = self.clock()
+            if self._last_back_off is not None and now - self._last_back_off < self.back_off_seconds:
+                return
+            self._last_back_off = now
+            for shed_name in self.sheddable:
+                self.limits[shed_name].back_off()
+
+    def metrics(self) -> str:
+        """Current limits and counters in Prometheus text exposition format."""
+        lines = []
+        gauges = [
+            ('ev_concurrency_limit', 'gauge', 'Current adaptive concurrency limit', lambda l: l.limit),
+            ('ev_concurrency_in_flight', 'gauge', 'Requests currently in flight', lambda l: l.in_flight),
+            ('ev_concurrency_latency_seconds', 'gauge', 'Recent average request latency', lambda l: l.short_rtt or 0.0),
+            ('ev_concurrency_shed_total', 'counter', 'Requests rejected with 503', lambda l: l.shed),
+        ]
+        for metric, kind, help_text, value in gauges:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for name in sorted(self.limits):
+                lines.append(f'{metric}{{route_class="{name}"}} {float(value(self.limits[name])):g}')
+        return '\n'.join(lines) + '\n'
+
+
+class ConcurrencyLimitMiddleware:
+    """ASGI middleware that sheds low-priority HTTP requests with a fast 503 and `Retry-After`."""
+
+    def __init__(self, app, limiter: ConcurrencyLimiter, retry_after: int = settings.LOAD_SHED_RETRY_AFTER_SECONDS):
+        self.app = app
+        self.limiter = limiter
+        self.retry_after = retry_after
+        self._body = json.dumps({'detail': 'Server is busy, retry later'}).encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        name = self.limiter.classify(scope['path'])
+        if not self.limiter.try_acquire(name):
+            await self._reject(send)
+            return
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release(name, time.perf_counter() - start)
+
+    async def _reject(self, send):
+        await send({
+            'type': 'http.response.start',
+            'status': 503,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(self._body)).encode()),
+                (b'retry-after', str(self.retry_after).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': self._body})
+
+
+concurrency_limiter = ConcurrencyLimiter()
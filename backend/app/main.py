@@ -1,28 +1,42 @@
+import asyncio
 import os
+from datetime import datetime, timezone
+from typing import Optional
 from fastapi import (
     FastAPI, Depends, HTTPException, WebSocket, 
-    WebSocketDisconnect, status, Request
+    WebSocketDisconnect, status, Request, Query
 )
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse 
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi.errors import RateLimitExceeded
+from starlette.concurrency import run_in_threadpool
 from . import security, crud, models, schemas, services, ml
 from .config import settings
-from .db import init_db, SessionLocal
+from .db import init_db, get_db, SessionLocal, engine
 from .logging_config import logger
+from .load_shedding import ConcurrencyLimitMiddleware, concurrency_limiter
 from .model import AnomalyModel
+from .inference_batcher import InferenceBatcher
+from .profiling import ProfiledRoute, ProfilingMiddleware, capture_file, install_db_timing, list_captures, timed
+from .snapshots import decompress_samples
+from .services.auto_ticketing import auto_ticketer
+from .services.dtc_analytics import dtc_index
+from .services.live_feed import live_feed, anomaly_event, ticket_event, SEVERITIES
 from .error_handlers import (
     custom_http_exception_handler,
     validation_exception_handler,
     global_exception_handler,
 )
 app = FastAPI(title=settings.APP_NAME)
+if settings.PROFILING_ENABLED:
+    # Must be set before any route is declared.
+    app.router.route_class = ProfiledRoute
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
@@ -39,6 +53,13 @@ app.add_exception_handler(HTTPException, custom_http_exception_handler)
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
 app.add_exception_handler(Exception, global_exception_handler)
 
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+    install_db_timing(engine)
+
+if settings.LOAD_SHED_ENABLED:
+    app.add_middleware(ConcurrencyLimitMiddleware, limiter=concurrency_limiter)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -47,6 +68,7 @@ app.add_middleware(
     allow_headers=['*'],
 )
 anomaly_model = AnomalyModel()
+inference_batcher = InferenceBatcher(anomaly_model)
 
 @app.on_event('startup')
 async def startup():
@@ -62,21 +84,28 @@ async def startup():
             logger.warning(f"Could not load anomaly detection model from {model_path}")
     else:
         logger.warning("No anomaly detection model found. Telemetry endpoint will not perform predictions.")
+    live_feed.start()
+    dtc_index.start()
+    auto_ticketer.start()
     logger.info("Startup complete.")
 
-def get_db():
-    """FastAPI dependency that provides and properly closes a database session."""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@app.on_event('shutdown')
+async def shutdown():
+    """Flushes pending automatic tickets before the worker exits."""
+    await auto_ticketer.stop()
+    await dtc_index.stop()
+    await live_feed.stop()
 
 @app.get("/health", tags=["General"])
 def health_check():
     """A simple endpoint to confirm the API is running."""
     return {"status": "ok"}
 
+@app.get("/metrics", response_class=PlainTextResponse, tags=["General"])
+def metrics():
+    """Prometheus metrics for this worker's adaptive concurrency limits."""
+    return concurrency_limiter.metrics()
+
 @app.post('/auth/register', response_model=dict, status_code=status.HTTP_201_CREATED, tags=["Auth"])
 @limiter.limit("5/minute")
 async def register(request: Request, u: schemas.UserCreate, db: Session = Depends(get_db)):
@@ -86,7 +115,8 @@ async def register(request: Request, u: schemas.UserCreate, db: Session = Depend
     if existing:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Username already exists')
     
-    user = crud.create_user(db, u)
+    # bcrypt takes hundreds of milliseconds; keep it off the event loop.
+    user = await run_in_threadpool(crud.create_user, db, u.dict())
     logger.info(f"User '{user.username}' created successfully.")
     return {'username': user.username, 'role': user.role}
 
@@ -95,7 +125,7 @@ async def register(request: Request, u: schemas.UserCreate, db: Session = Depend
 async def login_for_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """Provides JWT access and refresh tokens for valid credentials."""
     logger.info(f"Token requested for user: {form_data.username}")
-    user = security.authenticate_user(db, form_data.username, form_data.password)
+    user = await run_in_threadpool(security.authenticate_user, db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid credentials')
     
@@ -144,11 +174,16 @@ async def train_parts(user: models.User = Depends(security.get_current_admin_use
 async def telemetry(t: schemas.Telemetry, user: models.User = Depends(security.get_current_user)):
     """Receives telemetry data and performs anomaly detection if a model is loaded."""
     score, label = None, None
-    
+    dtc_index.observe(t.vehicle_id, t.dtc_codes)
+
     if anomaly_model.is_loaded():
-        feat = anomaly_model.prepare_features_single(t.dict())
-        score = anomaly_model.score(feat.reshape(1, -1))[0]
-        label = anomaly_model.predict(feat.reshape(1, -1))[0]
+        with timed('feature_prep'):
+            feat = anomaly_model.prepare_features_single(t.dict())
+        with timed('inference'):
+            score, label = await inference_batcher.submit(feat)
+        queued = auto_ticketer.observe(t.vehicle_id, t.dict(), score)
+        if t.vehicle_id is not None and (queued or label == -1):
+            live_feed.publish(anomaly_event(t.vehicle_id, score, queued, t.time_s))
         logger.info(f"Telemetry from vehicle {t.vehicle_id} processed.", extra={"score": score, "label": label})
     else:
         logger.info(f"Received telemetry from vehicle {t.vehicle_id}, but no model is loaded for analysis.")
@@ -156,14 +191,72 @@ async def telemetry(t: schemas.Telemetry, user: models.User = Depends(security.g
     return {'telemetry': t.dict(), 'score': score, 'label': label}
 
 
-@app.post('/tickets', response_model=schemas.Ticket, status_code=status.HTTP_201_CREATED, tags=["Tickets"])
+# The DTC handlers are async so they run on the event loop thread, like
+# ingest in /telemetry; DtcIndex is not thread-safe.
+@app.get('/dtc/top', response_model=schemas.DtcTopOut, tags=["DTC"])
+async def dtc_top_codes(window_minutes: int = Query(60, ge=1, le=24*60), k: int = Query(10, ge=1, le=100),
+                        user: models.User = Depends(security.get_current_user)):
+    """Most frequently reported diagnostic trouble codes across the fleet (approximate without Redis)."""
+    window = window_minutes * 60
+    codes = [{'code': c, 'count': n, 'vehicles': v} for c, n, v in await dtc_index.top_codes(window, k)]
+    return {'window_seconds': window, 'codes': codes}
+
+@app.get('/dtc/{code}/vehicles', response_model=schemas.DtcCodeActivityOut, tags=["DTC"])
+async def dtc_code_vehicles(code: str, window_minutes: int = Query(60, ge=1, le=24*60),
+                            limit: int = Query(100, ge=1, le=1000),
+                            user: models.User = Depends(security.get_current_user)):
+    """Vehicles that reported a code within the window, most recent first, with per-bucket counts."""
+    window = window_minutes * 60
+    count, buckets, vehicles = await dtc_index.code_activity(code, window, limit)
+    return {
+        'code': code,
+        'window_seconds': window,
+        'count': count,
+        'buckets': [{'start': datetime.fromtimestamp(start, tz=timezone.utc), 'count': n} for start, n in buckets],
+        'vehicles': [{'vehicle_id': v, 'last_seen': datetime.fromtimestamp(seen, tz=timezone.utc)} for v, seen in vehicles],
+    }
+
+
+@app.post('/tickets', response_model=schemas.TicketOut, status_code=status.HTTP_201_CREATED, tags=["Tickets"])
 async def create_ticket(req: schemas.TicketCreate, user: models.User = Depends(security.get_current_user), db: Session = Depends(get_db)):
     """Creates a new ticket and assigns it to the technician with the fewest open tickets."""
     logger.info(f"Ticket creation request received for vehicle_id: {req.vehicle_id}")
     ticket = await services.ticket_service.create_and_assign_ticket(db, req)
     logger.info(f"Ticket {ticket.id} created and assigned to user_id: {ticket.assigned_to}")
+    live_feed.publish(ticket_event(ticket, created=True))
     return ticket
 
+@app.get('/tickets', response_model=schemas.TicketPage, tags=["Tickets"])
+def list_tickets(
+    status_: Optional[str] = Query(None, alias='status'),
+    priority: Optional[str] = None,
+    assigned_to: Optional[int] = None,
+    vehicle_id: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    user: models.User = Depends(security.get_current_staff_user),
+    db: Session = Depends(get_db),
+):
+    """Lists tickets newest first. Pass `next_cursor` from a page back as `cursor` to fetch the next one."""
+    try:
+        items, next_cursor = crud.list_tickets(
+            db, status=status_, priority=priority, assigned_to=assigned_to, vehicle_id=vehicle_id,
+            created_after=created_after, created_before=created_before, cursor=cursor, limit=limit,
+        )
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+    return {'items': items, 'next_cursor': next_cursor}
+
+@app.get('/tickets/{ticket_id}/snapshot', response_model=schemas.TicketSnapshotOut, tags=["Tickets"])
+def get_ticket_snapshot(ticket_id: int, user: models.User = Depends(security.get_current_staff_user), db: Session = Depends(get_db)):
+    """Returns the full telemetry snapshot stored with a ticket."""
+    snap = crud.get_ticket_snapshot(db, ticket_id)
+    if snap is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Snapshot not found')
+    return {'ticket_id': snap.ticket_id, 'sample_count': snap.sample_count, 'samples': decompress_samples(snap.data)}
+
 @app.websocket('/ws/stream')
 async def ws_stream(websocket: WebSocket):
     """Handles WebSocket connections for real-time data streaming."""
@@ -187,4 +280,68 @@ async def ws_stream(websocket: WebSocket):
     except Exception:
         logger.warning(f"WebSocket connection for user {username} closed due to an error.", exc_info=True)
         if not websocket.client_state == 'DISCONNECTED':
-             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
\ No newline at end of file
+             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+
+@app.websocket('/ws/live')
+async def ws_live(websocket: WebSocket):
+    """
+    Live feed of anomalies and ticket changes. Query parameters: `token`,
+    optional `vehicle_id` (omit for the whole fleet) and `severity`
+    (minimum level: info, warning or critical).
+    """
+    token = websocket.query_params.get('token')
+    vehicle_id = websocket.query_params.get('vehicle_id')
+    severity = websocket.query_params.get('severity', 'info')
+    if not token or severity not in SEVERITIES:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    try:
+        username = security.decode_token(token).get('sub', 'unknown')
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    sub = live_feed.subscribe(vehicle_id=vehicle_id, min_severity=severity)
+    logger.info(f"Live feed subscriber connected: {username}", extra={"vehicle_id": vehicle_id, "severity": severity})
+
+    async def send_events():
+        while True:
+            for text in await sub.get():
+                await websocket.send_text(text)
+            lag = sub.lag_report()
+            if lag:
+                await websocket.send_text(lag)
+
+    async def wait_for_disconnect():
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+
+    tasks = [asyncio.create_task(send_events()), asyncio.create_task(wait_for_disconnect())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        live_feed.unsubscribe(sub)
+        logger.info(f"Live feed subscriber disconnected: {username}", extra={"dropped": sub.dropped, "coalesced": sub.coalesced})
+
+@app.get('/live/stats', tags=["Live"])
+def live_feed_stats(user: models.User = Depends(security.get_current_admin_user)):
+    """Subscriber count and delivery counters for this worker's live feed."""
+    return live_feed.stats()
+
+@app.get('/admin/profiles', tags=["Admin"])
+def profile_captures(limit: int = Query(50, ge=1, le=1000), user: models.User = Depends(security.get_current_admin_user)):
+    """Captured slow and profiled requests on this worker, newest first, with their phase breakdowns."""
+    return list_captures()[:limit]
+
+@app.get('/admin/profiles/{capture_id}', tags=["Admin"])
+def download_profile_capture(capture_id: str, kind: str = Query('profile', pattern='^(profile|record)$'),
+                             user: models.User = Depends(security.get_current_admin_user)):
+    """Downloads a capture's speedscope flamegraph (open it at speedscope.app) or its JSON record."""
+    path = capture_file(capture_id, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail='Capture not found')
+    return FileResponse(path, media_type='application/json', filename=os.path.basename(path))
@@ -0,0 +1,40 @@
+"""
+Brings the database schema up to date before the app starts.
+
+    python -m app.migrate
+
+A database without a `tickets` table is new: it is created from the models
+and stamped at the latest revision. Anything else is upgraded with alembic.
+Run this once per deploy, before the workers start; their startup
+`init_db()` only creates missing tables and never alters existing ones.
+"""
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from .db import engine, init_db
+from .logging_config import logger
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def alembic_config() -> Config:
+    cfg = Config(os.path.join(BACKEND_DIR, 'alembic.ini'))
+    cfg.set_main_option('script_location', os.path.join(BACKEND_DIR, 'migrations'))
+    return cfg
+
+
+def migrate():
+    cfg = alembic_config()
+    if not inspect(engine).has_table('tickets'):
+        logger.info("Empty database, creating schema and stamping head")
+        init_db()
+        command.stamp(cfg, 'head')
+    else:
+        command.upgrade(cfg, 'head')
+
+
+if __name__ == '__main__':
+    migrate()
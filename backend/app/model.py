@@ -15,7 +15,9 @@ class AnomalyModel:
         self.path = path or os.path.join(settings.MODELS_DIR, 'model_iforest.joblib')
         self.model = None
 
-    def load(self):
+    def load(self, path=None):
+        if path:
+            self.path = path
         if os.path.exists(self.path):
             self.model = joblib.load(self.path)
             return True
@@ -25,6 +27,13 @@ class AnomalyModel:
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
         joblib.dump(clf, self.path)
 
+    def is_loaded(self):
+        return self.model is not None
+
+    @staticmethod
+    def prepare_features_single(row: dict):
+        return prepare_features_single(row)
+
     def predict(self, feat):
         if self.model is None:
             raise RuntimeError('Model not loaded')
@@ -32,4 +41,14 @@ class AnomalyModel:
 
     def score(self, feat):
         if self.model is None: raise RuntimeError('Model not loaded')
-        return self.model.score_samples(feat)
\ No newline at end of file
+        return self.model.score_samples(feat)
+
+    def score_and_predict(self, feats):
+        """
+        Scores and labels a batch in one pass. IsolationForest.predict is
+        score_samples shifted by offset_, so the labels come for free.
+        """
+        if self.model is None: raise RuntimeError('Model not loaded')
+        scores = self.model.score_samples(feats)
+        labels = np.where(scores - self.model.offset_ < 0, -1, 1)
+        return scores, labels
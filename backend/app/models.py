@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index, LargeBinary, Float, and_
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
 from .db import Base
 
+def _utcnow():
+    return datetime.now(timezone.utc)
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True, index=True)
@@ -20,14 +24,46 @@ class User(Base):
 
 class Ticket(Base):
     __tablename__ = 'tickets'
-    
+    # Listing is keyset-paginated on (created_at, id), so every filter index
+    # ends with those columns to serve both the WHERE and the ORDER BY.
+    __table_args__ = (
+        Index('ix_tickets_created_at_id', 'created_at', 'id'),
+        Index('ix_tickets_status_created_at_id', 'status', 'created_at', 'id'),
+        Index('ix_tickets_assigned_to_status_created_at_id', 'assigned_to', 'status', 'created_at', 'id'),
+        Index('ix_tickets_vehicle_id_created_at_id', 'vehicle_id', 'created_at', 'id'),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     description = Column(Text, nullable=True)
     priority = Column(String, default='normal')
     status = Column(String, default='open')
     vehicle_id = Column(String, nullable=True)
-    telemetry_snapshot = Column(Text, nullable=True)  
     assigned_to = Column(Integer, ForeignKey('users.id'), nullable=True)
+    source = Column(String, default='manual', server_default='manual', nullable=False)  # 'manual' or 'auto'
+    anomaly_count = Column(Integer, default=0, server_default='0', nullable=False)
+    anomaly_score = Column(Float, nullable=True)  # worst (lowest) score seen for auto tickets
+    last_anomaly_at = Column(DateTime(timezone=True), nullable=True)
+    # Set client-side so the stored value keeps microseconds and compares
+    # consistently with cursor parameters (SQLite's CURRENT_TIMESTAMP does not).
+    created_at = Column(DateTime(timezone=True), default=_utcnow, server_default=func.now())
+    assigned_user = relationship('User', back_populates="tickets")
+    snapshot = relationship('TicketSnapshot', back_populates='ticket', uselist=False, cascade='all, delete-orphan')
+
+# At most one open automatic ticket per vehicle, and one open fleet-wide
+# (vehicle_id NULL) ticket, across all workers.
+_open_auto = and_(Ticket.source == 'auto', Ticket.status == 'open')
+Index(
+    'ux_tickets_open_auto_vehicle', func.coalesce(Ticket.vehicle_id, ''), unique=True,
+    postgresql_where=_open_auto, sqlite_where=_open_auto,
+)
+
+class TicketSnapshot(Base):
+    """Compressed window of telemetry samples attached to a ticket, loaded only on demand."""
+    __tablename__ = 'ticket_snapshots'
+
+    ticket_id = Column(Integer, ForeignKey('tickets.id', ondelete='CASCADE'), primary_key=True)
+    sample_count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    assigned_user = relationship('User', back_populates="tickets")
\ No newline at end of file
+    ticket = relationship('Ticket', back_populates='snapshot')
\ No newline at end of file
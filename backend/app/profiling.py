@@ -0,0 +1,261 @@
+import functools
+import inspect
+import json
+import os
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .config import settings
+from .db import SessionLocal
+from .logging_config import logger
+
+# Phase timings for the request being handled, or None when nothing is being
+# recorded. Sync dependencies and DB calls run in the threadpool with a copy
+# of the context, which still points at the same dict.
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('request_timings', default=None)
+
+PHASES = ('auth', 'db', 'feature_prep', 'inference', 'serialization')
+ENDPOINT_DONE = '_endpoint_done'
+
+
+class _Timer:
+    __slots__ = ('phase', 'timings', 'start')
+
+    def __init__(self, phase: str, timings: Dict[str, float]):
+        self.phase = phase
+        self.timings = timings
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings[self.phase] = self.timings.get(self.phase, 0.0) + time.perf_counter() - self.start
+
+
+class _NullTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(phase: str):
+    """Context manager adding the enclosed time to `phase` for the current request, if it is being timed."""
+    timings = _timings.get()
+    return _NULL_TIMER if timings is None else _Timer(phase, timings)
+
+
+def install_db_timing(engine):
+    """Counts time spent executing SQL towards the `db` phase."""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _timings.get() is not None:
+            conn.info.setdefault('_profiling_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        timings = _timings.get()
+        starts = conn.info.get('_profiling_start')
+        if timings is not None and starts:
+            timings['db'] = timings.get('db', 0.0) + time.perf_counter() - starts.pop()
+
+
+class ProfiledRoute(APIRoute):
+    """
+    Route that notes when the endpoint function returns, so the time until the
+    response starts (response model validation and serialisation) can be
+    reported as its own phase.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, self._wrap(endpoint), **kwargs)
+
+    @staticmethod
+    def _wrap(endpoint):
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    _mark_endpoint_done()
+        else:
+            @functools.wraps(endpoint)
+            def wrapper(*args, **kwargs):
+                try:
+                    return endpoint(*args, **kwargs)
+                finally:
+                    _mark_endpoint_done()
+        return wrapper
+
+
+def _mark_endpoint_done():
+    timings = _timings.get()
+    if timings is not None:
+        timings[ENDPOINT_DONE] = time.perf_counter()
+
+
+def _is_admin_token(token: str, session_factory) -> bool:
+    """True if the token is valid and its user currently has the admin role, as `get_current_admin_user` checks."""
+    from .security import decode_token
+
+    try:
+        username = decode_token(token).get('sub')
+    except Exception:
+        return False
+    if username is None:
+        return False
+    db = session_factory()
+    try:
+        user = db.query(models.User).filter(models.User.username == username).first()
+        return user is not None and user.role == 'admin'
+    finally:
+        db.close()
+
+
+class ProfilingMiddleware:
+    """
+    Times every HTTP request by phase and captures the slow or selected ones.
+
+    A request is profiled with pyinstrument when an admin sends the
+    `X-Profile: 1` header or it falls in the `sample_rate` fraction. The
+    profile is saved as a speedscope flamegraph. Any request slower than
+    `slow_ms` is saved with its phase breakdown. Captures go to `directory`,
+    which keeps the newest `max_captures`. Only add this middleware when
+    profiling is enabled; nothing is installed otherwise.
+    """
+
+    def __init__(self, app, directory: str = settings.PROFILE_DIR, sample_rate: float = settings.PROFILE_SAMPLE_RATE,
+                 slow_ms: float = settings.PROFILE_SLOW_REQUEST_MS, max_captures: int = settings.PROFILE_MAX_CAPTURES,
+                 interval: float = 0.001, session_factory=SessionLocal):
+        self.app = app
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_captures = max_captures
+        self.interval = interval
+        self.session_factory = session_factory
+
+    async def _wants_profile(self, scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        headers = dict(scope['headers'])
+        if headers.get(b'x-profile') not in (b'1', b'true'):
+            return False
+        auth = headers.get(b'authorization', b'').decode()
+        if not auth.lower().startswith('bearer '):
+            return False
+        return await run_in_threadpool(_is_admin_token, auth[7:], self.session_factory)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        profiler = None
+        if await self._wants_profile(scope):
+            try:
+                from pyinstrument import Profiler
+                profiler = Profiler(interval=self.interval, async_mode='enabled')
+            except ImportError:
+                logger.warning("Profiling requested but pyinstrument is not installed")
+
+        timings: Dict[str, float] = {}
+        token = _timings.set(timings)
+        response = {'status': None, 'started': None}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['started'] = time.perf_counter()
+            await send(message)
+
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            _timings.reset(token)
+            total = time.perf_counter() - start
+            if profiler is not None or total * 1000 >= self.slow_ms:
+                if ENDPOINT_DONE in timings and response['started']:
+                    timings['serialization'] = response['started'] - timings.pop(ENDPOINT_DONE)
+                timings.pop(ENDPOINT_DONE, None)
+                try:
+                    await run_in_threadpool(self._save, scope, response['status'], total, timings, profiler)
+                except Exception:
+                    logger.warning("Could not save request capture", exc_info=True)
+
+    def _save(self, scope, status, total, timings, profiler):
+        os.makedirs(self.directory, exist_ok=True)
+        capture_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        breakdown = {phase: round(timings.get(phase, 0.0) * 1000, 3) for phase in PHASES}
+        breakdown['other'] = round(max(0.0, total * 1000 - sum(breakdown.values())), 3)
+        record = {
+            'id': capture_id,
+            'method': scope['method'],
+            'path': scope['path'],
+            'status': status,
+            'duration_ms': round(total * 1000, 3),
+            'breakdown_ms': breakdown,
+            'profile': None,
+            'created_at': time.time(),
+        }
+        if profiler is not None:
+            from pyinstrument.renderers import SpeedscopeRenderer
+            record['profile'] = f'{capture_id}.speedscope.json'
+            with open(os.path.join(self.directory, record['profile']), 'w') as f:
+                f.write(profiler.output(renderer=SpeedscopeRenderer()))
+        with open(os.path.join(self.directory, f'{capture_id}.json'), 'w') as f:
+            json.dump(record, f)
+        logger.info("Captured request profile", extra=record)
+        self._prune()
+
+    def _prune(self):
+        records = sorted(f for f in os.listdir(self.directory) if f.endswith('.json') and not f.endswith('.speedscope.json'))
+        for name in records[:max(0, len(records) - self.max_captures)]:
+            capture_id = name[:-len('.json')]
+            for path in (name, f'{capture_id}.speedscope.json'):
+                try:
+                    os.remove(os.path.join(self.directory, path))
+                except FileNotFoundError:
+                    pass
+
+
+def list_captures(directory: str = settings.PROFILE_DIR) -> List[dict]:
+    """Returns capture records, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    records = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith('.json') and not name.endswith('.speedscope.json'):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    records.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return records
+
+
+def capture_file(capture_id: str, kind: str, directory: str = settings.PROFILE_DIR) -> Optional[str]:
+    """Path of a capture's record (`kind='record'`) or flamegraph (`kind='profile'`), if it exists."""
+    if not capture_id.replace('-', '').isalnum():
+        return None
+    suffix = '.speedscope.json' if kind == 'profile' else '.json'
+    path = os.path.join(directory, capture_id + suffix)
+    return path if os.path.isfile(path) else None
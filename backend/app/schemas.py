@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from datetime import datetime
+from pydantic import BaseModel, Field, validator
+from typing import Optional, List, Union
+from .config import settings
 
 class UserCreate(BaseModel):
     username: str
@@ -12,11 +14,27 @@ class Token(BaseModel):
     access_token: str
     token_type: str = 'bearer'
 
+class TokenWithRefresh(Token):
+    refresh_token: str
+
+class RefreshToken(BaseModel):
+    refresh_token: str
+
+class User(BaseModel):
+    id: int
+    username: str
+    email: Optional[str] = None
+    role: str
+    phone: Optional[str] = None
+    class Config:
+        orm_mode = True
+
 class TokenData(BaseModel):
     username: Optional[str] = None
     role: Optional[str] = None
 
 class Telemetry(BaseModel):
+    vehicle_id: Optional[str] = None
     time_s: int
     pack_voltage: float
     pack_current: float
@@ -34,17 +52,72 @@ class Telemetry(BaseModel):
 class TicketCreate(BaseModel):
     title: str
     description: Optional[str] = None
-    telemetry_snapshot: Optional[dict] = None
+    # Either a single reading or a window of samples leading up to the issue.
+    telemetry_snapshot: Optional[Union[List[dict], dict]] = None
     priority: str = 'normal'
     vehicle_id: Optional[str] = None
 
+    @validator('telemetry_snapshot')
+    def snapshot_as_samples(cls, v):
+        if v is None:
+            return v
+        samples = [v] if isinstance(v, dict) else v
+        if len(samples) > settings.TICKET_SNAPSHOT_MAX_SAMPLES:
+            raise ValueError(f'telemetry_snapshot holds at most {settings.TICKET_SNAPSHOT_MAX_SAMPLES} samples')
+        return samples
+
+class TicketAssignee(BaseModel):
+    id: int
+    username: str
+    class Config:
+        orm_mode = True
+
 class TicketOut(BaseModel):
     id: int
     title: str
     description: Optional[str]
-    created_at: float
+    created_at: datetime
     priority: str
     vehicle_id: Optional[str]
     status: str
     assigned_to: Optional[int]
-    telemetry_snapshot: Optional[dict]
\ No newline at end of file
+    assigned_user: Optional[TicketAssignee] = None
+    source: str = 'manual'
+    anomaly_count: int = 0
+    anomaly_score: Optional[float] = None
+    last_anomaly_at: Optional[datetime] = None
+    class Config:
+        orm_mode = True
+
+class TicketPage(BaseModel):
+    items: List[TicketOut]
+    next_cursor: Optional[str] = None
+
+class TicketSnapshotOut(BaseModel):
+    ticket_id: int
+    sample_count: int
+    samples: List[dict]
+
+class DtcCodeCount(BaseModel):
+    code: str
+    count: int
+    vehicles: int
+
+class DtcTopOut(BaseModel):
+    window_seconds: int
+    codes: List[DtcCodeCount]
+
+class DtcVehicle(BaseModel):
+    vehicle_id: str
+    last_seen: datetime
+
+class DtcBucket(BaseModel):
+    start: datetime
+    count: int
+
+class DtcCodeActivityOut(BaseModel):
+    code: str
+    window_seconds: int
+    count: int
+    buckets: List[DtcBucket]
+    vehicles: List[DtcVehicle]
@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from passlib.context import CryptContext
@@ -5,19 +6,13 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from .config import settings
-from .db import SessionLocal
+from .db import get_db
 from . import models
+from .profiling import timed
 
 pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/auth/token')
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def verify_password(plain, hashed):
     return pwd_context.verify(plain, hashed)
 
@@ -27,12 +22,28 @@ def get_password_hash(password):
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({'exp': expire})
+    # jti keeps tokens issued within the same second distinct
+    to_encode.update({'exp': expire, 'jti': uuid.uuid4().hex})
     # use primary key to sign
     key = settings.SECRET_KEYS[0]
     encoded = jwt.encode(to_encode, key, algorithm=settings.ALGORITHM)
     return encoded
 
+def create_refresh_token(data: dict):
+    to_encode = data.copy()
+    to_encode.update({'exp': datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS), 'type': 'refresh', 'jti': uuid.uuid4().hex})
+    return jwt.encode(to_encode, settings.SECRET_KEYS[0], algorithm=settings.ALGORITHM)
+
+def verify_refresh_token(db: Session, token: str):
+    """Returns the username of a valid refresh token whose user still exists."""
+    payload = decode_token(token)
+    username = payload.get('sub')
+    if payload.get('type') != 'refresh' or username is None:
+        raise HTTPException(status_code=401, detail='Invalid refresh token')
+    if db.query(models.User).filter(models.User.username==username).first() is None:
+        raise HTTPException(status_code=401, detail='User not found')
+    return username
+
 def decode_token(token: str):
     # try each key for rotation support
     last_exc = None
@@ -53,11 +64,23 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    payload = decode_token(token)
-    username = payload.get('sub')
-    if username is None:
-        raise HTTPException(status_code=401, detail='Invalid token payload')
-    user = db.query(models.User).filter(models.User.username==username).first()
-    if user is None:
-        raise HTTPException(status_code=401, detail='User not found')
-    return user
\ No newline at end of file
+    with timed('auth'):
+        payload = decode_token(token)
+        username = payload.get('sub')
+        if username is None or payload.get('type') == 'refresh':
+            raise HTTPException(status_code=401, detail='Invalid token payload')
+        user = db.query(models.User).filter(models.User.username==username).first()
+        if user is None:
+            raise HTTPException(status_code=401, detail='User not found')
+        return user
+
+def get_current_admin_user(user: models.User = Depends(get_current_user)):
+    if user.role != 'admin':
+        raise HTTPException(status_code=403, detail='Admin privileges required')
+    return user
+
+def get_current_staff_user(user: models.User = Depends(get_current_user)):
+    # Tickets span the whole fleet and carry raw telemetry, so drivers may not read them.
+    if user.role not in ('technician', 'admin'):
+        raise HTTPException(status_code=403, detail='Technician or admin privileges required')
+    return user
@@ -0,0 +1 @@
+from . import ticket_service
@@ -0,0 +1,383 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .. import models
+from ..config import settings
+from ..db import SessionLocal
+from ..logging_config import logger
+from ..snapshots import compress_samples, decompress_samples
+from . import ticket_service
+from .email_service import send_email_async
+from .live_feed import live_feed, ticket_event
+
+SNAPSHOT_FIELDS = (
+    'time_s', 'pack_voltage', 'pack_current', 'soc', 'soh', 'cell_temp_max', 'cell_temp_min',
+    'coolant_temp', 'motor_rpm', 'motor_torque', 'inverter_temp', 'speed_kph',
+)
+FLEET_VEHICLES_LISTED = 50
+
+
+class _VehicleContext:
+    """
+    Fixed-size ring buffer of the most recent samples from one vehicle.
+    Readings are kept as float32, which is ample for sensor values and halves
+    the buffer; timestamps stay float64 so epoch seconds survive.
+    """
+    __slots__ = ('times', 'rows', 'pos', 'filled', 'last_seen')
+
+    def __init__(self, size: int):
+        self.times = np.zeros(size)
+        self.rows = np.zeros((size, len(SNAPSHOT_FIELDS) - 1), dtype=np.float32)
+        self.pos = 0
+        self.filled = 0
+        self.last_seen = 0.0
+
+    def push(self, sample: dict, now: float):
+        self.times[self.pos] = float(sample.get('time_s') or 0.0)
+        self.rows[self.pos] = [float(sample.get(f) or 0.0) for f in SNAPSHOT_FIELDS[1:]]
+        self.pos = (self.pos + 1) % len(self.rows)
+        self.filled = min(self.filled + 1, len(self.rows))
+        self.last_seen = now
+
+    def window(self):
+        """Returns copies of the buffered timestamps and readings, oldest first."""
+        if self.filled < len(self.rows):
+            return self.times[:self.filled].copy(), self.rows[:self.filled].copy()
+        return np.roll(self.times, -self.pos), np.roll(self.rows, -self.pos, axis=0)
+
+
+class _Incident:
+    """
+    Anomalies from one vehicle accumulated between two flushes. The context
+    window is copied from the vehicle's buffer once, when the flush starts.
+    """
+    __slots__ = ('vehicle_id', 'count', 'worst_score', 'last_at', 'context', 'window')
+
+    def __init__(self, vehicle_id: str, context: _VehicleContext):
+        self.vehicle_id = vehicle_id
+        self.count = 0
+        self.worst_score = None
+        self.last_at = None
+        self.context = context
+        self.window = None
+
+    def samples(self) -> List[dict]:
+        times, rows = self.window
+        out = []
+        for t, row in zip(times.tolist(), rows.tolist()):
+            sample = dict(zip(SNAPSHOT_FIELDS[1:], row))
+            sample['time_s'] = int(t)
+            out.append(sample)
+        return out
+
+
+def _merge_samples(old: List[dict], new: List[dict], limit: int) -> List[dict]:
+    """
+    Merges two sample windows by `time_s`, keeping the last `limit` in time
+    order. Samples present in both come from `new`. Windows from different
+    workers interleave, so neither replaces the other.
+    """
+    merged = {s.get('time_s'): s for s in old}
+    merged.update((s.get('time_s'), s) for s in new)
+    return sorted(merged.values(), key=lambda s: s.get('time_s') or 0)[-limit:]
+
+
+class AutoTicketer:
+    """
+    Opens and updates tickets for vehicles whose anomaly score crosses a threshold.
+
+    `observe` runs on the request path and only touches in-memory state: it
+    records the sample in the vehicle's context buffer and, for anomalous
+    samples, folds it into that vehicle's pending incident. A background task
+    flushes pending incidents every `flush_seconds` in a single transaction;
+    a failed flush puts its incidents back for the next one.
+
+    An open automatic ticket for a vehicle is updated rather than duplicated.
+    A unique index makes that hold across workers: an insert that loses the
+    race is folded into the winner's ticket. A flush with more than
+    `fleet_event_vehicles` new incidents becomes one fleet-wide ticket, so a
+    fleet-wide event costs one write per flush. Later incidents join the
+    fleet ticket only while the event is still active, i.e. it saw anomalies
+    within `fleet_event_window` seconds; after that they get their own tickets.
+    """
+
+    def __init__(self, threshold: Optional[float] = settings.AUTO_TICKET_SCORE_THRESHOLD,
+                 context_samples: int = settings.AUTO_TICKET_CONTEXT_SAMPLES,
+                 flush_seconds: float = settings.AUTO_TICKET_FLUSH_SECONDS,
+                 fleet_event_vehicles: int = settings.AUTO_TICKET_FLEET_EVENT_VEHICLES,
+                 idle_seconds: float = settings.AUTO_TICKET_IDLE_SECONDS,
+                 fleet_event_window: float = settings.AUTO_TICKET_FLEET_EVENT_WINDOW_SECONDS,
+                 session_factory=SessionLocal):
+        self.threshold = threshold
+        self.context_samples = context_samples
+        self.flush_seconds = flush_seconds
+        self.fleet_event_vehicles = fleet_event_vehicles
+        self.idle_seconds = idle_seconds
+        self.fleet_event_window = fleet_event_window
+        self.session_factory = session_factory
+        self._contexts: Dict[str, _VehicleContext] = {}
+        self._pending: Dict[str, _Incident] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold is not None
+
+    def observe(self, vehicle_id: Optional[str], sample: dict, score: float) -> bool:
+        """Records a scored sample. Returns True if it was anomalous and queued for ticketing."""
+        if not self.enabled or vehicle_id is None:
+            return False
+        now = time.monotonic()
+        ctx = self._contexts.get(vehicle_id)
+        if ctx is None:
+            ctx = self._contexts[vehicle_id] = _VehicleContext(self.context_samples)
+        ctx.push(sample, now)
+        if score >= self.threshold:
+            return False
+
+        incident = self._pending.get(vehicle_id)
+        if incident is None:
+            incident = self._pending[vehicle_id] = _Incident(vehicle_id, ctx)
+        incident.count += 1
+        incident.worst_score = score if incident.worst_score is None else min(incident.worst_score, score)
+        incident.last_at = datetime.now(timezone.utc)
+        return True
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception:
+                logger.error("Auto-ticketing flush failed", exc_info=True)
+
+    async def flush(self):
+        """Writes all pending incidents in one transaction, then notifies technicians and the live feed."""
+        self._evict_idle()
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        # Copied here, on the event loop, since ingest keeps writing the buffers.
+        for incident in batch.values():
+            incident.window = incident.context.window()
+        try:
+            created, events = await run_in_threadpool(self._write_batch, list(batch.values()))
+        except Exception:
+            self._requeue(batch)
+            raise
+        for event in events:
+            live_feed.publish(event)
+        await self._notify(created)
+
+    def _requeue(self, batch: Dict[str, _Incident]):
+        """Puts the incidents of a failed flush back, merged with any that arrived meanwhile."""
+        for vehicle_id, old in batch.items():
+            incident = self._pending.get(vehicle_id)
+            if incident is None:
+                self._pending[vehicle_id] = old
+                continue
+            incident.count += old.count
+            incident.worst_score = min(incident.worst_score, old.worst_score)
+            incident.last_at = max(incident.last_at, old.last_at)
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        for vehicle_id in [v for v, ctx in self._contexts.items() if ctx.last_seen < cutoff]:
+            del self._contexts[vehicle_id]
+
+    def _write_batch(self, incidents: List[_Incident]):
+        """
+        Applies a batch of incidents. Returns (technician email, ticket title) pairs
+        for new tickets and live feed events for every ticket touched.
+        """
+        db = self.session_factory()
+        try:
+            created = self._apply(db, incidents)
+            db.commit()
+            return created
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _open_auto_tickets(db: Session, vehicle_ids: List[Optional[str]]) -> List[models.Ticket]:
+        """Open automatic tickets for `vehicle_ids` (None is the fleet-wide ticket), locked until commit."""
+        match = models.Ticket.vehicle_id.in_([v for v in vehicle_ids if v is not None])
+        if None in vehicle_ids:
+            match = match | models.Ticket.vehicle_id.is_(None)
+        return (
+            db.query(models.Ticket)
+            .filter(models.Ticket.source == 'auto', models.Ticket.status == 'open')
+            .filter(match)
+            .with_for_update()
+            .all()
+        )
+
+    def _insert(self, db: Session, ticket: models.Ticket) -> Optional[models.Ticket]:
+        """
+        Inserts a new open automatic ticket. If another worker opened one for the
+        same vehicle first, the unique index rejects the insert and that ticket
+        is returned instead, locked.
+        """
+        try:
+            with db.begin_nested():
+                db.add(ticket)
+            return None
+        except IntegrityError:
+            return self._open_auto_tickets(db, [ticket.vehicle_id])[0]
+
+    @staticmethod
+    def _technician_id(loads) -> Optional[int]:
+        # Assigned by id rather than through the relationship, so a ticket
+        # whose insert loses a race never lands in the user's tickets collection.
+        tech = ticket_service.take_least_loaded(loads)
+        return tech.id if tech else None
+
+    def _fleet_event_active(self, fleet_ticket: Optional[models.Ticket], new_incidents: int) -> bool:
+        if new_incidents > self.fleet_event_vehicles:
+            return True
+        if fleet_ticket is None or fleet_ticket.last_anomaly_at is None:
+            return False
+        last = fleet_ticket.last_anomaly_at
+        if last.tzinfo is None:
+            last = last.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - last <= timedelta(seconds=self.fleet_event_window)
+
+    def _apply(self, db: Session, incidents: List[_Incident]):
+        open_auto = self._open_auto_tickets(db, [i.vehicle_id for i in incidents] + [None])
+        by_vehicle = {t.vehicle_id: t for t in open_auto if t.vehicle_id is not None}
+        fleet_ticket = next((t for t in open_auto if t.vehicle_id is None), None)
+
+        snapshots = {
+            s.ticket_id: s for s in db.query(models.TicketSnapshot)
+            .filter(models.TicketSnapshot.ticket_id.in_([t.id for t in by_vehicle.values()]))
+        }
+        touched = []
+        for incident in incidents:
+            ticket = by_vehicle.get(incident.vehicle_id)
+            if ticket is not None:
+                self._update(ticket, incident.count, incident.worst_score, incident.last_at)
+                self._merge_snapshot(ticket, snapshots.get(ticket.id), incident.samples())
+                touched.append(ticket)
+
+        new = [i for i in incidents if i.vehicle_id not in by_vehicle]
+        if not new:
+            db.flush()
+            return [], [ticket_event(t, created=False) for t in touched]
+        loads = ticket_service.technician_loads(db)
+        created = []
+        if self._fleet_event_active(fleet_ticket, len(new)):
+            if fleet_ticket is None:
+                ticket = models.Ticket(
+                    title='Fleet-wide anomaly', priority='high', source='auto', anomaly_count=0,
+                    assigned_to=self._technician_id(loads),
+                )
+                fleet_ticket = self._insert(db, ticket)
+                if fleet_ticket is None:
+                    fleet_ticket = ticket
+                    created.append(ticket)
+            if not created:
+                touched.append(fleet_ticket)
+            self._update(
+                fleet_ticket, sum(i.count for i in new), min(i.worst_score for i in new), max(i.last_at for i in new),
+            )
+            vehicles = self._merge_fleet_snapshot(
+                fleet_ticket, [dict(i.samples()[-1], vehicle_id=i.vehicle_id) for i in new],
+            )
+            at_least = 'At least ' if len(vehicles) >= settings.TICKET_SNAPSHOT_MAX_SAMPLES else ''
+            listed = sorted(vehicles)[:FLEET_VEHICLES_LISTED]
+            fleet_ticket.description = (
+                f"{at_least}{len(vehicles)} vehicles crossed the anomaly threshold during this event, "
+                f"including: {', '.join(listed)}"
+            )
+        else:
+            for incident in new:
+                ticket = models.Ticket(
+                    title=f'Anomaly detected on vehicle {incident.vehicle_id}', priority='high',
+                    vehicle_id=incident.vehicle_id, source='auto', anomaly_count=0,
+                    assigned_to=self._technician_id(loads),
+                )
+                self._update(ticket, incident.count, incident.worst_score, incident.last_at)
+                ticket.snapshot = ticket_service.build_snapshot(incident.samples())
+                existing = self._insert(db, ticket)
+                if existing is None:
+                    created.append(ticket)
+                else:
+                    self._update(existing, incident.count, incident.worst_score, incident.last_at)
+                    self._merge_snapshot(existing, existing.snapshot, incident.samples())
+                    touched.append(existing)
+        db.flush()
+        logger.info(f"Auto-ticketing flush: {len(incidents)} incidents, {len(created)} new tickets")
+        events = [ticket_event(t, created=False) for t in touched] + [ticket_event(t, created=True) for t in created]
+        return [(t.assigned_user.email if t.assigned_user else None, t.title) for t in created], events
+
+    @staticmethod
+    def _update(ticket: models.Ticket, count: int, worst_score: float, last_at: datetime):
+        ticket.anomaly_count = (ticket.anomaly_count or 0) + count
+        ticket.anomaly_score = worst_score if ticket.anomaly_score is None else min(ticket.anomaly_score, worst_score)
+        ticket.last_anomaly_at = last_at
+        if ticket.vehicle_id is not None:
+            ticket.description = f"{ticket.anomaly_count} anomalous samples, worst score {ticket.anomaly_score:.3f}"
+
+    def _merge_snapshot(self, ticket: models.Ticket, snapshot: Optional[models.TicketSnapshot], samples: List[dict]):
+        limit = settings.TICKET_SNAPSHOT_MAX_SAMPLES
+        if snapshot is None:
+            ticket.snapshot = ticket_service.build_snapshot(samples[-limit:])
+            return
+        merged = _merge_samples(decompress_samples(snapshot.data), samples, limit)
+        snapshot.sample_count = len(merged)
+        snapshot.data = compress_samples(merged)
+
+    def _merge_fleet_snapshot(self, ticket: models.Ticket, samples: List[dict]) -> List[str]:
+        """
+        Keeps the latest sample of each affected vehicle, most recently affected
+        last, and returns the vehicles it holds.
+        """
+        limit = settings.TICKET_SNAPSHOT_MAX_SAMPLES
+        snapshot = ticket.snapshot if ticket.id else None
+        latest = {s['vehicle_id']: s for s in decompress_samples(snapshot.data)} if snapshot else {}
+        for sample in samples:
+            latest.pop(sample['vehicle_id'], None)
+            latest[sample['vehicle_id']] = sample
+        merged = list(latest.values())[-limit:]
+        if snapshot is None:
+            ticket.snapshot = ticket_service.build_snapshot(merged)
+        else:
+            snapshot.sample_count = len(merged)
+            snapshot.data = compress_samples(merged)
+        return [s['vehicle_id'] for s in merged]
+
+    async def _notify(self, created):
+        """Sends each technician one digest for the tickets opened in this flush."""
+        digests: Dict[str, List[str]] = {}
+        for email, title in created:
+            if email:
+                digests.setdefault(email, []).append(title)
+        for email, titles in digests.items():
+            await send_email_async(email, f"{len(titles)} new anomaly ticket(s)", "\n".join(titles))
+
+
+auto_ticketer = AutoTicketer()
@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import heapq
+import time
+from collections import Counter, OrderedDict, deque
+from itertools import islice, takewhile
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from ..config import settings
+from ..logging_config import logger
+
+KEY_PREFIX = 'ev:dtc'
+
+
+class DtcIndex:
+    """
+    Streaming fleet-wide index of diagnostic trouble codes.
+
+    Time is split into fixed buckets kept in a ring covering the retention
+    window. Each bucket holds a count-min sketch of code occurrences and a
+    small space-saving table of heavy-hitter candidates, so memory is fixed
+    regardless of traffic and window queries sum a few sketches instead of
+    scanning telemetry. Alongside, an inverted index maps each code to the
+    vehicles reporting it and when they last did; it is pruned as buckets
+    expire. Per code it also counts vehicles by the bucket they were last
+    seen in, so distinct-vehicle counts cost a few buckets, not a scan.
+
+    Ingest only bumps plain dict counters; they are folded into the current
+    bucket's sketch in one vectorised update every `fold_every` samples, at
+    bucket rollover, and before each query. Expired index entries are pruned
+    a few at a time on later samples, not all at once at rollover.
+
+    That state is per process, so with several workers each would answer for
+    the telemetry it received. Once started with `REDIS_URL` set, the index
+    is shared instead: ingest buffers per-bucket code counts and vehicle
+    sightings, and a background task adds them every `sync_seconds` to
+    per-bucket Redis hashes (exact counts) and per-code sorted sets of
+    vehicles scored by last sighting. Queries read the merged Redis state, so
+    they include every worker's telemetry, up to `sync_seconds` behind.
+
+    Not thread-safe; ingest and queries must all run on the event loop.
+    """
+
+    def __init__(self, bucket_seconds: int = settings.DTC_BUCKET_SECONDS,
+                 retention_seconds: int = settings.DTC_RETENTION_SECONDS,
+                 width: int = settings.DTC_SKETCH_WIDTH, depth: int = settings.DTC_SKETCH_DEPTH,
+                 candidates_per_bucket: int = settings.DTC_TOPK_CAPACITY, fold_every: int = 1024,
+                 prune_batch: int = 256, redis_url: Optional[str] = settings.REDIS_URL,
+                 sync_seconds: float = settings.DTC_SYNC_SECONDS, clock=time.time):
+        self.bucket_seconds = bucket_seconds
+        self.retention_seconds = retention_seconds
+        self.n_buckets = max(1, retention_seconds // bucket_seconds)
+        self.width = width
+        self.depth = depth
+        self.candidates_per_bucket = candidates_per_bucket
+        self.fold_every = fold_every
+        self.prune_batch = prune_batch
+        self.redis_url = redis_url
+        self.sync_seconds = sync_seconds
+        self.clock = clock
+        self._sketches = np.zeros((self.n_buckets, depth, width), dtype=np.int32)
+        self._epochs = np.full(self.n_buckets, -1, dtype=np.int64)
+        self._candidates: List[Dict[str, int]] = [{} for _ in range(self.n_buckets)]
+        # code -> {vehicle: last seen}, least recently seen first.
+        self._vehicles: Dict[str, 'OrderedDict[str, float]'] = {}
+        # code -> {epoch: vehicles whose last sighting falls in that bucket}.
+        self._last_seen: Dict[str, Dict[int, int]] = {}
+        self._prune_queue: deque = deque()
+        self._prune_cutoff = 0.0
+        self._columns: Dict[str, np.ndarray] = {}
+        self._rows = np.arange(depth)
+        self._pending: Dict[str, int] = {}
+        self._pending_epoch = -1
+        self._pending_samples = 0
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+        self._outbox_counts: Dict[int, Counter] = {}
+        self._outbox_seen: Dict[str, Dict[str, float]] = {}
+
+    def _cols(self, code: str) -> np.ndarray:
+        cols = self._columns.get(code)
+        if cols is None:
+            digest = hashlib.blake2b(code.encode(), digest_size=16).digest()
+            h1 = int.from_bytes(digest[:8], 'little')
+            h2 = int.from_bytes(digest[8:], 'little') | 1
+            cols = np.array([(h1 + i * h2) % self.width for i in range(self.depth)], dtype=np.intp)
+            if len(self._columns) < 65536:
+                self._columns[code] = cols
+        return cols
+
+    def _slot(self, epoch: int) -> int:
+        slot = epoch % self.n_buckets
+        if self._epochs[slot] != epoch:
+            self._sketches[slot] = 0
+            self._candidates[slot] = {}
+            self._epochs[slot] = epoch
+        return slot
+
+    def _prune_some(self, budget: int):
+        """
+        Drops up to `budget` inverted-index entries older than the retention
+        window. Queries filter by time anyway, so this only bounds memory.
+        """
+        queue, cutoff = self._prune_queue, self._prune_cutoff
+        while queue and budget > 0:
+            code = queue[0]
+            vehicles = self._vehicles.get(code)
+            while vehicles and budget > 0 and next(iter(vehicles.values())) < cutoff:
+                _, seen = vehicles.popitem(last=False)
+                self._forget_sighting(code, int(seen // self.bucket_seconds))
+                budget -= 1
+            if budget <= 0:
+                return
+            queue.popleft()
+            budget -= 1
+            if vehicles is not None and not vehicles:
+                del self._vehicles[code]
+                self._last_seen.pop(code, None)
+
+    def _forget_sighting(self, code: str, epoch: int):
+        by_epoch = self._last_seen[code]
+        if by_epoch[epoch] == 1:
+            del by_epoch[epoch]
+        else:
+            by_epoch[epoch] -= 1
+
+    def observe(self, vehicle_id: Optional[str], codes: Iterable[str], ts: Optional[float] = None):
+        """Records the codes reported by one telemetry sample."""
+        if not codes:
+            return
+        ts = self.clock() if ts is None else ts
+        epoch = int(ts // self.bucket_seconds)
+        if self._redis is not None:
+            counts = self._outbox_counts.get(epoch)
+            if counts is None:
+                counts = self._outbox_counts[epoch] = Counter()
+            for code in codes:
+                counts[code] += 1
+                if vehicle_id is not None:
+                    self._outbox_seen.setdefault(code, {})[vehicle_id] = ts
+            return
+
+        if epoch != self._pending_epoch:
+            self._fold()
+            self._pending_epoch = epoch
+            cutoff = (epoch - self.n_buckets + 1) * self.bucket_seconds
+            if cutoff > self._prune_cutoff:
+                self._prune_cutoff = cutoff
+                self._prune_queue = deque(self._vehicles)
+        pending = self._pending
+        for code in codes:
+            pending[code] = pending.get(code, 0) + 1
+            if vehicle_id is not None:
+                vehicles = self._vehicles.get(code)
+                if vehicles is None:
+                    vehicles = self._vehicles[code] = OrderedDict()
+                    self._last_seen[code] = {}
+                previous = vehicles.get(vehicle_id)
+                if previous is not None:
+                    self._forget_sighting(code, int(previous // self.bucket_seconds))
+                by_epoch = self._last_seen[code]
+                by_epoch[epoch] = by_epoch.get(epoch, 0) + 1
+                vehicles[vehicle_id] = ts
+                vehicles.move_to_end(vehicle_id)
+        self._pending_samples += 1
+        if self._pending_samples >= self.fold_every:
+            self._fold()
+        if self._prune_queue:
+            self._prune_some(self.prune_batch)
+
+    def _fold(self):
+        """Moves buffered counts into the sketch and candidate table of their bucket."""
+        pending, self._pending, self._pending_samples = self._pending, {}, 0
+        if not pending:
+            return
+        slot = self._slot(self._pending_epoch)
+        codes = list(pending)
+        counts = np.fromiter(pending.values(), dtype=np.int32, count=len(codes))
+        cols = np.stack([self._cols(c) for c in codes])
+        flat = (self._rows * self.width)[None, :] + cols
+        np.add.at(self._sketches[slot].reshape(-1), flat.ravel(), np.repeat(counts, self.depth))
+
+        # Space-saving, applied per batch: codes new to the table inherit the
+        # smallest tracked count, then only the strongest candidates are kept.
+        candidates = self._candidates[slot]
+        floor = min(candidates.values()) if len(candidates) >= self.candidates_per_bucket else 0
+        for code, c in pending.items():
+            candidates[code] = candidates.get(code, floor) + c
+        if len(candidates) > self.candidates_per_bucket:
+            keep = heapq.nlargest(self.candidates_per_bucket, candidates.items(), key=lambda item: item[1])
+            self._candidates[slot] = dict(keep)
+
+    def _window_slots(self, window_seconds: float, now: float) -> np.ndarray:
+        last = int(now // self.bucket_seconds)
+        first = int((now - window_seconds) // self.bucket_seconds) + 1
+        first = max(first, last - self.n_buckets + 1)
+        return np.nonzero((self._epochs >= first) & (self._epochs <= last))[0]
+
+    def _bucket_counts(self, slots: np.ndarray, codes: List[str]) -> np.ndarray:
+        """Per-bucket count-min estimates, shaped (len(slots), len(codes))."""
+        cols = np.stack([self._cols(c) for c in codes])
+        return self._sketches[slots[:, None, None], self._rows[None, None, :], cols[None, :, :]].min(axis=2)
+
+    def _vehicle_count(self, code: str, epochs: range) -> int:
+        """Vehicles whose last sighting of `code` falls in one of `epochs`."""
+        return sum(n for epoch, n in self._last_seen.get(code, {}).items() if epoch in epochs)
+
+    async def top_codes(self, window_seconds: float, k: int = 10):
+        """Returns up to `k` (code, estimated count, vehicles) tuples, most frequent first."""
+        if self._redis is not None:
+            return await self._redis_top_codes(window_seconds, k)
+        return self._local_top_codes(window_seconds, k)
+
+    async def code_activity(self, code: str, window_seconds: float, limit: int = 100):
+        """
+        Returns (estimated count, per-bucket counts, vehicles) for one code.
+        Vehicles are (vehicle_id, last_seen) pairs, most recent first.
+        """
+        if self._redis is not None:
+            return await self._redis_code_activity(code, window_seconds, limit)
+        return self._local_code_activity(code, window_seconds, limit)
+
+    def _local_top_codes(self, window_seconds: float, k: int):
+        self._fold()
+        now = self.clock()
+        slots = self._window_slots(window_seconds, now)
+        codes = sorted(set().union(*(self._candidates[s] for s in slots))) if len(slots) else []
+        if not codes:
+            return []
+        counts = self._bucket_counts(slots, codes).sum(axis=0)
+        order = np.argsort(-counts, kind='stable')[:k]
+        epochs = self._epochs_in(window_seconds, now)
+        return [(codes[i], int(counts[i]), self._vehicle_count(codes[i], epochs)) for i in order]
+
+    def _local_code_activity(self, code: str, window_seconds: float, limit: int):
+        self._fold()
+        now = self.clock()
+        slots = self._window_slots(window_seconds, now)
+        per_bucket = self._bucket_counts(slots, [code])[:, 0]
+        buckets = sorted(
+            (int(self._epochs[s]) * self.bucket_seconds, int(c)) for s, c in zip(slots, per_bucket) if c
+        )
+        since = now - window_seconds
+        # Entries are in last-seen order, so walk back from the newest and
+        # stop at the window edge or once `limit` are collected.
+        recent = reversed(self._vehicles.get(code, OrderedDict()).items())
+        vehicles = list(islice(takewhile(lambda item: item[1] >= since, recent), limit))
+        return sum(c for _, c in buckets), buckets, vehicles
+
+    def start(self):
+        if self.redis_url and self._task is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            await self.sync()
+        except Exception:
+            logger.warning("Final DTC sync to Redis failed", exc_info=True)
+        await self._redis.aclose()
+        self._redis = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sync_seconds)
+            try:
+                await self.sync()
+            except Exception:
+                logger.warning("DTC sync to Redis failed; will retry", exc_info=True)
+
+    def _epochs_in(self, window_seconds: float, now: float) -> range:
+        last = int(now // self.bucket_seconds)
+        first = max(int((now - window_seconds) // self.bucket_seconds) + 1, last - self.n_buckets + 1)
+        return range(first, last + 1)
+
+    async def sync(self):
+        """Adds this worker's buffered counts and sightings to the shared Redis index."""
+        if self._redis is None or not (self._outbox_counts or self._outbox_seen):
+            return
+        counts, self._outbox_counts = self._outbox_counts, {}
+        seen, self._outbox_seen = self._outbox_seen, {}
+        cutoff = self.clock() - self.retention_seconds
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for epoch, by_code in counts.items():
+                    key = f'{KEY_PREFIX}:count:{epoch}'
+                    for code, n in by_code.items():
+                        pipe.hincrby(key, code, n)
+                    pipe.expire(key, self.retention_seconds + self.bucket_seconds)
+                for code, vehicles in seen.items():
+                    key = f'{KEY_PREFIX}:vehicles:{code}'
+                    pipe.zadd(key, vehicles, gt=True)
+                    pipe.zremrangebyscore(key, '-inf', f'({cutoff}')
+                    pipe.expire(key, self.retention_seconds)
+                await pipe.execute()
+        except Exception:
+            self._requeue(counts, seen)
+            raise
+
+    def _requeue(self, counts: Dict[int, Counter], seen: Dict[str, Dict[str, float]]):
+        for epoch, by_code in counts.items():
+            self._outbox_counts.setdefault(epoch, Counter()).update(by_code)
+        for code, vehicles in seen.items():
+            pending = self._outbox_seen.setdefault(code, {})
+            for vehicle_id, ts in vehicles.items():
+                pending[vehicle_id] = max(ts, pending.get(vehicle_id, ts))
+
+    async def _redis_top_codes(self, window_seconds: float, k: int):
+        await self.sync()
+        now = self.clock()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for epoch in self._epochs_in(window_seconds, now):
+                pipe.hgetall(f'{KEY_PREFIX}:count:{epoch}')
+            totals = Counter()
+            for by_code in await pipe.execute():
+                totals.update({code: int(n) for code, n in by_code.items()})
+        top = sorted(totals.items(), key=lambda item: (-item[1], item[0]))[:k]
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for code, _ in top:
+                pipe.zcount(f'{KEY_PREFIX}:vehicles:{code}', now - window_seconds, '+inf')
+            vehicles = await pipe.execute()
+        return [(code, n, v) for (code, n), v in zip(top, vehicles)]
+
+    async def _redis_code_activity(self, code: str, window_seconds: float, limit: int):
+        await self.sync()
+        now = self.clock()
+        epochs = self._epochs_in(window_seconds, now)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for epoch in epochs:
+                pipe.hget(f'{KEY_PREFIX}:count:{epoch}', code)
+            pipe.zrevrangebyscore(f'{KEY_PREFIX}:vehicles:{code}', '+inf', now - window_seconds,
+                                  start=0, num=limit, withscores=True)
+            *per_bucket, vehicles = await pipe.execute()
+        buckets = [(epoch * self.bucket_seconds, int(n)) for epoch, n in zip(epochs, per_bucket) if n]
+        return sum(n for _, n in buckets), buckets, [(v, float(seen)) for v, seen in vehicles]
+
+
+dtc_index = DtcIndex()
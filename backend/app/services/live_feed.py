@@ -0,0 +1,243 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+from ..config import settings
+from ..logging_config import logger
+
+SEVERITIES = {'info': 0, 'warning': 1, 'critical': 2}
+CHANNEL = 'ev:live'
+
+
+class Subscription:
+    """
+    One dashboard client's view of the feed.
+
+    Pending events live in a bounded ordered map keyed by what they describe
+    (a vehicle's anomaly state, a ticket). A newer event for the same key
+    replaces the queued one, and when the map is full the oldest event is
+    dropped. Either way the publisher never waits on a slow client.
+    """
+
+    def __init__(self, vehicle_id: Optional[str] = None, min_severity: str = 'info',
+                 maxsize: int = settings.LIVE_FEED_QUEUE_SIZE):
+        self.vehicle_id = vehicle_id
+        self.min_level = SEVERITIES[min_severity]
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.coalesced = 0
+        self._reported = (0, 0)
+        self._queue: 'OrderedDict[str, str]' = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def offer(self, key: str, text: str):
+        if key in self._queue:
+            del self._queue[key]
+            self.coalesced += 1
+        elif len(self._queue) >= self.maxsize:
+            self._queue.popitem(last=False)
+            self.dropped += 1
+        self._queue[key] = text
+        self._ready.set()
+
+    async def get(self) -> List[str]:
+        """Waits for and returns every queued event, oldest first."""
+        await self._ready.wait()
+        self._ready.clear()
+        texts = list(self._queue.values())
+        self._queue.clear()
+        return texts
+
+    def lag_report(self) -> Optional[str]:
+        """Returns a `lag` message if events were coalesced or dropped since the last report."""
+        if (self.dropped, self.coalesced) == self._reported:
+            return None
+        dropped, coalesced = self.dropped - self._reported[0], self.coalesced - self._reported[1]
+        self._reported = (self.dropped, self.coalesced)
+        return json.dumps({'type': 'lag', 'dropped': dropped, 'coalesced': coalesced})
+
+
+class LiveFeed:
+    """
+    Fans out anomaly and ticket events to websocket subscribers.
+
+    `publish` only enqueues. A background pump wakes every `tick_seconds`,
+    drains the queue and keeps only the newest event per key (a vehicle's
+    anomaly state, a ticket). A key is sent at most once per `key_interval`:
+    its first event goes out on the next tick, later ones wait and only the
+    newest is sent when the interval is up. Fan-out cost therefore follows
+    the number of distinct keys, not the raw event rate. Due events are
+    either published to Redis in one message per tick (so subscribers on
+    every worker receive them through their reader task) or, without
+    `REDIS_URL`, dispatched straight to local subscribers.
+    """
+
+    def __init__(self, redis_url: Optional[str] = settings.REDIS_URL,
+                 outbound_size: int = settings.LIVE_FEED_OUTBOUND_SIZE,
+                 tick_seconds: float = settings.LIVE_FEED_TICK_SECONDS,
+                 key_interval: float = settings.LIVE_FEED_KEY_INTERVAL_SECONDS):
+        self.redis_url = redis_url
+        self.tick_seconds = tick_seconds
+        self.key_interval = key_interval
+        self._outbound: asyncio.Queue = asyncio.Queue(maxsize=outbound_size)
+        self._held: Dict[str, str] = {}
+        self._sent_at: 'OrderedDict[str, float]' = OrderedDict()
+        self._fleet: Set[Subscription] = set()
+        self._by_vehicle: Dict[str, Set[Subscription]] = {}
+        self._redis = None
+        self._tasks: List[asyncio.Task] = []
+        self.published = 0
+        self.dropped_outbound = 0
+        self.coalesced_outbound = 0
+
+    def subscribe(self, vehicle_id: Optional[str] = None, min_severity: str = 'info') -> Subscription:
+        sub = Subscription(vehicle_id, min_severity)
+        if vehicle_id is None:
+            self._fleet.add(sub)
+        else:
+            self._by_vehicle.setdefault(vehicle_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        if sub.vehicle_id is None:
+            self._fleet.discard(sub)
+        else:
+            subs = self._by_vehicle.get(sub.vehicle_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._by_vehicle[sub.vehicle_id]
+
+    def publish(self, event: dict):
+        """Queues an event with `type`, `key`, `severity` and optionally `vehicle_id`. Never blocks."""
+        text = json.dumps(event, default=str)
+        try:
+            self._outbound.put_nowait((event.get('key') or text, text))
+            self.published += 1
+        except asyncio.QueueFull:
+            self.dropped_outbound += 1
+
+    def start(self):
+        if self._tasks:
+            return
+        if self.redis_url:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url)
+            self._tasks.append(asyncio.create_task(self._read_redis()))
+        self._tasks.append(asyncio.create_task(self._pump()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _pump(self):
+        while True:
+            if not self._held:
+                self._hold(*await self._outbound.get())
+            await asyncio.sleep(self.tick_seconds)
+            while not self._outbound.empty():
+                self._hold(*self._outbound.get_nowait())
+            due = self._take_due(time.monotonic())
+            if due:
+                await self._send(due)
+
+    def _hold(self, key: str, text: str):
+        if key in self._held:
+            self.coalesced_outbound += 1
+        self._held[key] = text
+
+    def _take_due(self, now: float) -> List[str]:
+        """Removes and returns held events whose key has not been sent within `key_interval`."""
+        sent_at = self._sent_at
+        while sent_at and now - next(iter(sent_at.values())) >= self.key_interval:
+            sent_at.popitem(last=False)
+        due = [key for key in self._held if key not in sent_at]
+        for key in due:
+            sent_at[key] = now
+        return [self._held.pop(key) for key in due]
+
+    async def _send(self, texts: List[str]):
+        if self._redis is not None:
+            try:
+                # json.dumps never emits raw newlines, so they can separate events.
+                await self._redis.publish(CHANNEL, '\n'.join(texts))
+                return
+            except Exception:
+                logger.warning("Live feed publish to Redis failed; delivering to local subscribers only", exc_info=True)
+        for text in texts:
+            self._dispatch(text)
+
+    async def _read_redis(self):
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self._receive(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Live feed Redis subscription lost; reconnecting", exc_info=True)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def _receive(self, data):
+        """Dispatches a batch published by any worker, skipping events that are not valid JSON."""
+        if isinstance(data, bytes):
+            data = data.decode()
+        for text in data.split('\n'):
+            try:
+                self._dispatch(text)
+            except ValueError:
+                logger.warning("Dropping malformed live feed event", extra={'event': text[:200]})
+
+    def _dispatch(self, text: str):
+        event = json.loads(text)
+        level = SEVERITIES.get(event.get('severity'), 0)
+        key = event.get('key') or text
+        targets = self._fleet
+        vehicle_id = event.get('vehicle_id')
+        if vehicle_id is not None and vehicle_id in self._by_vehicle:
+            targets = targets | self._by_vehicle[vehicle_id]
+        for sub in targets:
+            if level >= sub.min_level:
+                sub.offer(key, text)
+
+    def stats(self) -> dict:
+        subs = list(self._fleet) + [s for subs in self._by_vehicle.values() for s in subs]
+        return {
+            'backend': 'redis' if self.redis_url else 'local',
+            'subscribers': len(subs),
+            'published': self.published,
+            'dropped_outbound': self.dropped_outbound,
+            'coalesced_outbound': self.coalesced_outbound,
+            'dropped': sum(s.dropped for s in subs),
+            'coalesced': sum(s.coalesced for s in subs),
+        }
+
+
+def anomaly_event(vehicle_id: str, score: float, critical: bool, time_s: int) -> dict:
+    return {
+        'type': 'anomaly', 'key': f'anomaly:{vehicle_id}', 'vehicle_id': vehicle_id,
+        'severity': 'critical' if critical else 'warning', 'score': score, 'time_s': time_s,
+    }
+
+def ticket_event(ticket, created: bool) -> dict:
+    return {
+        'type': 'ticket_created' if created else 'ticket_updated', 'key': f'ticket:{ticket.id}',
+        'vehicle_id': ticket.vehicle_id, 'severity': 'critical' if ticket.priority == 'high' else 'warning',
+        'ticket_id': ticket.id, 'title': ticket.title, 'priority': ticket.priority, 'status': ticket.status,
+        'assigned_to': ticket.assigned_to, 'anomaly_count': ticket.anomaly_count,
+    }
+
+
+live_feed = LiveFeed()
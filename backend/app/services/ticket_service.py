@@ -0,0 +1,52 @@
+import heapq
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .. import models, schemas
+from ..snapshots import compress_samples
+
+
+def technician_loads(db: Session):
+    """Returns a heap of (open_ticket_count, user_id, user) for every technician."""
+    open_count = func.count(models.Ticket.id)
+    rows = (
+        db.query(models.User, open_count)
+        .outerjoin(models.Ticket, (models.Ticket.assigned_to == models.User.id) & (models.Ticket.status == 'open'))
+        .filter(models.User.role == 'technician')
+        .group_by(models.User.id)
+        .all()
+    )
+    loads = [(count, user.id, user) for user, count in rows]
+    heapq.heapify(loads)
+    return loads
+
+def take_least_loaded(loads):
+    """Pops the least-loaded technician from a `technician_loads` heap and counts the new ticket against them."""
+    if not loads:
+        return None
+    count, user_id, user = heapq.heappop(loads)
+    heapq.heappush(loads, (count + 1, user_id, user))
+    return user
+
+def pick_technician(db: Session):
+    """Returns the technician with the fewest open tickets, or None if there are none."""
+    return take_least_loaded(technician_loads(db))
+
+def build_snapshot(samples):
+    return models.TicketSnapshot(sample_count=len(samples), data=compress_samples(samples))
+
+async def create_and_assign_ticket(db: Session, req: schemas.TicketCreate) -> models.Ticket:
+    """Creates a ticket, stores its telemetry snapshot compressed, and assigns it to the least-loaded technician."""
+    tech = pick_technician(db)
+    ticket = models.Ticket(
+        title=req.title,
+        description=req.description,
+        priority=req.priority,
+        vehicle_id=req.vehicle_id,
+        assigned_to=tech.id if tech else None,
+    )
+    if req.telemetry_snapshot:
+        ticket.snapshot = build_snapshot(req.telemetry_snapshot)
+    db.add(ticket)
+    db.commit()
+    db.refresh(ticket)
+    return ticket
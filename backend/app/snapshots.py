@@ -0,0 +1,17 @@
+import json
+import zlib
+from typing import List
+
+# Ticket telemetry snapshots are stored zlib-compressed in their own table so
+# that ticket queries never carry the blob. Samples are serialised as compact
+# JSON; repeated keys across a window of samples compress very well.
+COMPRESSION_LEVEL = 6
+
+def compress_samples(samples: List[dict]) -> bytes:
+    """Serialises a window of telemetry samples into the stored binary form."""
+    raw = json.dumps(samples, separators=(',', ':'), default=str).encode()
+    return zlib.compress(raw, COMPRESSION_LEVEL)
+
+def decompress_samples(data: bytes) -> List[dict]:
+    """Inverse of `compress_samples`."""
+    return json.loads(zlib.decompress(data))
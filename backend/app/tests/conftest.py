@@ -31,6 +31,11 @@ def override_get_db():
         db.close()
 app.dependency_overrides[get_db] = override_get_db
 
+@pytest.fixture
+def session_factory():
+    """Session factory bound to the test database, for code that opens its own sessions."""
+    return TestingSessionLocal
+
 @pytest.fixture(scope="function")
 def client():
     """Provides a TestClient instance for making API requests in tests."""
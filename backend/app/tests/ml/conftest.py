@@ -3,10 +3,10 @@ import os
 import pytest
 import pandas as pd
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
-from app.ml.model import load_model 
 @pytest.fixture(scope="session")
 def model():
     """Fixture to load the ML model once for the entire test session."""
+    from app.ml.model import load_model
     return load_model()
 
 @pytest.fixture(scope="session")
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from app import models
+from app.services.auto_ticketing import AutoTicketer, _merge_samples
+
+
+def test_sustained_fault_updates_one_ticket(session_factory):
+    ticketer = AutoTicketer(threshold=-0.6, context_samples=20, fleet_event_vehicles=5, session_factory=session_factory)
+
+    async def run():
+        for i in range(10):
+            ticketer.observe('VIN-AUTO', {'time_s': i, 'soc': 50.0}, -0.3)
+        for flush in range(3):
+            for i in range(10):
+                ticketer.observe('VIN-AUTO', {'time_s': 10 + flush * 10 + i, 'soc': 50.0}, -0.8)
+            await ticketer.flush()
+    asyncio.run(run())
+
+    db = session_factory()
+    tickets = db.query(models.Ticket).filter(models.Ticket.vehicle_id == 'VIN-AUTO').all()
+    assert len(tickets) == 1
+    assert tickets[0].source == 'auto'
+    assert tickets[0].anomaly_count == 30
+    assert tickets[0].snapshot.sample_count == 40
+    db.close()
+
+
+def test_fleet_wide_event_opens_single_ticket(session_factory):
+    ticketer = AutoTicketer(threshold=-0.6, context_samples=5, fleet_event_vehicles=5, session_factory=session_factory)
+
+    async def run():
+        for v in range(50):
+            ticketer.observe(f'VIN-HEAT-{v}', {'time_s': 1, 'cell_temp_max': 58.0}, -0.7)
+        await ticketer.flush()
+    asyncio.run(run())
+
+    db = session_factory()
+    assert db.query(models.Ticket).filter(models.Ticket.vehicle_id.like('VIN-HEAT-%')).count() == 0
+    fleet = db.query(models.Ticket).filter(models.Ticket.source == 'auto', models.Ticket.vehicle_id.is_(None)).one()
+    assert fleet.anomaly_count == 50
+    db.close()
+
+
+def test_fleet_ticket_only_absorbs_incidents_while_event_is_active(session_factory):
+    db = session_factory()
+    db.query(models.Ticket).filter(models.Ticket.vehicle_id.is_(None)).update({'status': 'closed'})
+    db.commit()
+    db.close()
+    ticketer = AutoTicketer(threshold=-0.6, context_samples=5, fleet_event_vehicles=5, fleet_event_window=60,
+                            session_factory=session_factory)
+
+    async def run(vehicles):
+        for v in vehicles:
+            ticketer.observe(v, {'time_s': 1, 'cell_temp_max': 58.0}, -0.7)
+        await ticketer.flush()
+
+    asyncio.run(run([f'VIN-WAVE-{v}' for v in range(10)]))
+    asyncio.run(run(['VIN-WAVE-0', 'VIN-LATE']))
+    db = session_factory()
+    fleet = db.query(models.Ticket).filter(models.Ticket.vehicle_id.is_(None), models.Ticket.status == 'open').one()
+    assert fleet.description.startswith('11 vehicles') and 'VIN-LATE' in fleet.description
+    fleet.last_anomaly_at = datetime.now(timezone.utc) - timedelta(minutes=10)
+    db.commit()
+    db.close()
+
+    asyncio.run(run(['VIN-REAL']))
+    db = session_factory()
+    assert db.query(models.Ticket).filter(models.Ticket.vehicle_id == 'VIN-REAL').count() == 1
+    db.close()
+
+
+def test_racing_worker_folds_into_existing_ticket(session_factory):
+    first = AutoTicketer(threshold=-0.6, context_samples=5, session_factory=session_factory)
+    second = AutoTicketer(threshold=-0.6, context_samples=5, session_factory=session_factory)
+    for ticketer in (first, second):
+        for i in range(3):
+            ticketer.observe('VIN-RACE', {'time_s': i}, -0.8)
+    asyncio.run(first.flush())
+
+    # The second worker looked before the first one committed.
+    lookup = second._open_auto_tickets
+    calls = []
+    def stale_lookup(db, vehicle_ids):
+        calls.append(vehicle_ids)
+        return [] if len(calls) == 1 else lookup(db, vehicle_ids)
+    second._open_auto_tickets = stale_lookup
+    asyncio.run(second.flush())
+
+    db = session_factory()
+    [ticket] = db.query(models.Ticket).filter(models.Ticket.vehicle_id == 'VIN-RACE').all()
+    assert ticket.anomaly_count == 6
+    db.close()
+
+
+def test_failed_flush_keeps_incidents(session_factory):
+    def broken_session():
+        raise RuntimeError('database unavailable')
+    ticketer = AutoTicketer(threshold=-0.6, context_samples=5, session_factory=broken_session)
+    ticketer.observe('VIN-RETRY', {'time_s': 0}, -0.7)
+    with pytest.raises(RuntimeError):
+        asyncio.run(ticketer.flush())
+    ticketer.observe('VIN-RETRY', {'time_s': 1}, -0.9)
+
+    ticketer.session_factory = session_factory
+    asyncio.run(ticketer.flush())
+    db = session_factory()
+    ticket = db.query(models.Ticket).filter(models.Ticket.vehicle_id == 'VIN-RETRY').one()
+    assert ticket.anomaly_count == 2
+    assert ticket.anomaly_score == pytest.approx(-0.9)
+    db.close()
+
+
+def test_interleaved_worker_windows_merge_by_time():
+    first = [{'time_s': t, 'soc': 1.0} for t in range(0, 60, 2)]
+    second = [{'time_s': t, 'soc': 2.0} for t in range(1, 60, 2)]
+    merged = _merge_samples(first, second, limit=100)
+    assert [s['time_s'] for s in merged] == list(range(60))
+
+    again = _merge_samples(merged, [{'time_s': 59, 'soc': 3.0}, {'time_s': 60, 'soc': 3.0}], limit=50)
+    assert [s['time_s'] for s in again] == list(range(11, 61))
+    assert again[-2]['soc'] == 3.0
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from app.services.dtc_analytics import DtcIndex
+
+
+def test_top_codes_and_vehicle_lookup():
+    now = [1_000_000.0]
+    index = DtcIndex(bucket_seconds=60, retention_seconds=3600, width=256, depth=4,
+                     candidates_per_bucket=8, fold_every=16, clock=lambda: now[0])
+    for step in range(600):
+        now[0] += 1
+        index.observe('VIN-1', ['P0A80'])
+        if step % 3 == 0:
+            index.observe('VIN-2', ['P0A80', 'U0100'])
+        index.observe(f'VIN-NOISE-{step}', [f'B{step:04d}'])
+
+    top = asyncio.run(index.top_codes(window_seconds=3600, k=2))
+    assert [code for code, _, _ in top] == ['P0A80', 'U0100']
+    assert top[0][1] >= 800
+    assert top[0][2] == 2
+
+    count, buckets, vehicles = asyncio.run(index.code_activity('U0100', window_seconds=3600))
+    assert count >= 200
+    assert sum(n for _, n in buckets) == count
+    assert [v for v, _ in vehicles] == ['VIN-2']
+
+
+def test_entries_expire_with_retention():
+    now = [1_000_000.0]
+    index = DtcIndex(bucket_seconds=60, retention_seconds=600, clock=lambda: now[0])
+    index.observe('VIN-OLD', ['P0001'])
+    now[0] += 3600
+    index.observe('VIN-NEW', ['P0002'])
+    assert asyncio.run(index.code_activity('P0001', window_seconds=600)) == (0, [], [])
+    assert [code for code, _, _ in asyncio.run(index.top_codes(window_seconds=600))] == ['P0002']
+
+
+def test_expired_vehicles_are_pruned_incrementally():
+    now = [1_000_000.0]
+    index = DtcIndex(bucket_seconds=60, retention_seconds=600, prune_batch=100, clock=lambda: now[0])
+    for v in range(20_000):
+        index.observe(f'VIN-{v}', ['P0A80'])
+    now[0] += 3600
+
+    # One sample prunes at most `prune_batch` entries, not all 20,000.
+    index.observe('VIN-LIVE', ['P0A80'])
+    assert len(index._vehicles['P0A80']) >= 20_000 - 100
+
+    for _ in range(250):
+        index.observe('VIN-LIVE', ['P0A80'])
+    assert list(index._vehicles['P0A80']) == ['VIN-LIVE']
+    assert sum(index._last_seen['P0A80'].values()) == 1
+
+
+def test_queries_do_not_scan_the_fleet():
+    now = [1_000_000.0]
+    index = DtcIndex(bucket_seconds=60, retention_seconds=3600, clock=lambda: now[0])
+    codes = [f'P{c:04d}' for c in range(10)]
+    for v in range(100_000):
+        if v % 100 == 0:
+            now[0] += 1
+        index.observe(f'VIN-{v}', codes)
+    now[0] += 60
+
+    async def best_of(n, query):
+        timings = []
+        for _ in range(n):
+            start = time.perf_counter()
+            result = await query()
+            timings.append(time.perf_counter() - start)
+        return result, min(timings)
+
+    async def run():
+        return (await best_of(3, lambda: index.top_codes(window_seconds=3600)),
+                await best_of(3, lambda: index.code_activity('P0005', window_seconds=3600, limit=50)))
+    (top, top_s), ((count, _, vehicles), activity_s) = asyncio.run(run())
+    assert sorted(code for code, _, _ in top) == codes
+    assert all(n == 100_000 for _, _, n in top)
+    assert count >= 100_000
+    assert [v for v, _ in vehicles[:2]] == ['VIN-99999', 'VIN-99998']
+    assert len(vehicles) == 50
+
+    # A scan of 100,000 vehicles per code took 150-300 ms; these touch a
+    # few buckets and `limit` entries, about 0.1 ms.
+    assert top_s < 0.02
+    assert activity_s < 0.02
+
+    # A short window only counts vehicles seen within it.
+    top = asyncio.run(index.top_codes(window_seconds=120, k=1))
+    assert top[0][2] < 100_000
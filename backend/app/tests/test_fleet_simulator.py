@@ -0,0 +1,14 @@
+from benchmarks.fleet_simulator import FAULT_DTCS, FleetModel, build_fleet
+
+
+def test_fleet_generates_valid_telemetry_with_injected_faults():
+    model = FleetModel.fit('app/data/parts_labeled.csv')
+    assert set(model.fault_offsets) == set(FAULT_DTCS)
+
+    fleet = build_fleet(model, 5, fault_rate=0.05, seed=3)
+    samples = [v.step() for _ in range(200) for v in fleet]
+
+    assert {s['vehicle_id'] for s in samples} == {v.vehicle_id for v in fleet}
+    assert all(20 < s['soc'] < 110 for s in samples)
+    assert any(v.faults_injected for v in fleet)
+    assert {c for s in samples for c in s['dtc_codes']} <= set(FAULT_DTCS.values())
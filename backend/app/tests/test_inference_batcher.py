@@ -0,0 +1,37 @@
+import asyncio
+import numpy as np
+import pytest
+from app.inference_batcher import InferenceBatcher
+
+
+class RecordingModel:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def score_and_predict(self, feats):
+        self.batch_sizes.append(len(feats))
+        scores = -feats[:, 0]
+        return scores, np.where(scores < -0.5, -1, 1)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_a_batch_and_get_their_own_result():
+    model = RecordingModel()
+    batcher = InferenceBatcher(model, max_batch=64, max_wait_ms=5.0)
+    feats = [np.array([i / 100, 0.0]) for i in range(100)]
+
+    results = await asyncio.gather(*(batcher.submit(f) for f in feats))
+
+    assert [score for score, _ in results] == [-i / 100 for i in range(100)]
+    assert [label for _, label in results] == [-1 if i > 50 else 1 for i in range(100)]
+    assert sum(model.batch_sizes) == 100
+    assert len(model.batch_sizes) < 10
+    assert max(model.batch_sizes) <= 64
+
+
+@pytest.mark.asyncio
+async def test_lone_requests_stop_waiting_for_company():
+    batcher = InferenceBatcher(RecordingModel(), max_batch=64, max_wait_ms=5.0)
+    for i in range(6):
+        await batcher.submit(np.array([0.1, 0.0]))
+    assert batcher.wait_ms < 0.5
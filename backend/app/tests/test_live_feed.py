@@ -0,0 +1,71 @@
+import asyncio
+import json
+from app.services.live_feed import LiveFeed, Subscription, anomaly_event
+
+
+def test_slow_subscriber_coalesces_and_drops():
+    async def run():
+        sub = Subscription(maxsize=3)
+        for i in range(5):
+            sub.offer('anomaly:VIN-1', json.dumps({'n': i}))
+        for v in range(5):
+            sub.offer(f'anomaly:VIN-{v + 2}', json.dumps({'v': v}))
+        texts = await sub.get()
+        return sub, texts
+    sub, texts = asyncio.run(run())
+    assert len(texts) == 3
+    assert sub.coalesced == 4
+    assert sub.dropped == 3
+    assert json.loads(sub.lag_report()) == {'type': 'lag', 'dropped': 3, 'coalesced': 4}
+    assert sub.lag_report() is None
+
+
+def test_local_fanout_respects_topic_filters():
+    async def run():
+        feed = LiveFeed(redis_url=None, tick_seconds=0)
+        fleet = feed.subscribe()
+        critical = feed.subscribe(min_severity='critical')
+        one_vehicle = feed.subscribe(vehicle_id='VIN-A')
+        other_vehicle = feed.subscribe(vehicle_id='VIN-B')
+        feed.start()
+        feed.publish(anomaly_event('VIN-A', -0.55, critical=False, time_s=1))
+        feed.publish(anomaly_event('VIN-C', -0.9, critical=True, time_s=1))
+        await asyncio.sleep(0.01)
+        await feed.stop()
+        queued = lambda sub: [json.loads(t)['vehicle_id'] for t in sub._queue.values()]
+        return queued(fleet), queued(critical), queued(one_vehicle), queued(other_vehicle)
+    fleet, critical, one_vehicle, other_vehicle = asyncio.run(run())
+    assert fleet == ['VIN-A', 'VIN-C']
+    assert critical == ['VIN-C']
+    assert one_vehicle == ['VIN-A']
+    assert other_vehicle == []
+
+
+def test_pump_coalesces_and_throttles_per_key():
+    async def run():
+        feed = LiveFeed(redis_url=None, tick_seconds=0.01, key_interval=0.2)
+        sub = feed.subscribe()
+        feed.start()
+        feed.publish(anomaly_event('VIN-A', -0.61, critical=False, time_s=0))
+        await asyncio.sleep(0.05)
+        first = await sub.get()
+        for t in range(1, 50):
+            feed.publish(anomaly_event('VIN-A', -0.61, critical=False, time_s=t))
+        await asyncio.sleep(0.05)
+        assert not sub._queue
+        await asyncio.sleep(0.25)
+        later = await sub.get()
+        await feed.stop()
+        return feed, first, later
+    feed, first, later = asyncio.run(run())
+    assert [json.loads(t)['time_s'] for t in first] == [0]
+    assert [json.loads(t)['time_s'] for t in later] == [49]
+    assert feed.coalesced_outbound == 48
+
+
+def test_malformed_redis_event_is_skipped():
+    feed = LiveFeed(redis_url=None)
+    sub = feed.subscribe()
+    good = anomaly_event('VIN-A', -0.7, critical=False, time_s=1)
+    feed._receive(b'{"truncated\n' + json.dumps(good).encode())
+    assert [json.loads(t)['vehicle_id'] for t in sub._queue.values()] == ['VIN-A']
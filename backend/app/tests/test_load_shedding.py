@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from httpx import AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from app.load_shedding import AdaptiveLimit, ConcurrencyLimiter, ConcurrencyLimitMiddleware
+
+
+def build_app(limiter, gate):
+    async def slow(request):
+        await gate.wait()
+        return JSONResponse({'ok': True})
+    app = Starlette(routes=[Route('/telemetry', slow, methods=['POST']), Route('/tickets', slow)])
+    app.add_middleware(ConcurrencyLimitMiddleware, limiter=limiter, retry_after=2)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_telemetry_is_shed_while_tickets_are_protected():
+    limiter = ConcurrencyLimiter(initial=2, min_limit=2, max_limit=2)
+    gate = asyncio.Event()
+    async with AsyncClient(app=build_app(limiter, gate), base_url='http://test') as client:
+        held = [asyncio.create_task(client.post('/telemetry')) for _ in range(2)]
+        tickets = [asyncio.create_task(client.get('/tickets')) for _ in range(4)]
+        await asyncio.sleep(0.05)
+
+        shed = await client.post('/telemetry')
+        assert shed.status_code == 503
+        assert shed.headers['retry-after'] == '2'
+
+        gate.set()
+        assert all(r.status_code == 200 for r in await asyncio.gather(*held, *tickets))
+    assert limiter.limits['telemetry'].shed == 1
+    assert limiter.limits['tickets'].shed == 0
+    assert 'ev_concurrency_limit{route_class="telemetry"} 2' in limiter.metrics()
+
+
+def test_limit_shrinks_when_latency_rises_and_recovers():
+    limit = AdaptiveLimit(initial=50, min_limit=4, max_limit=200)
+    for _ in range(200):
+        limit.on_sample(0.01, in_flight=50)
+    steady = limit.limit
+    assert steady > 50
+    for _ in range(50):
+        limit.on_sample(0.2, in_flight=int(limit.limit))
+    assert limit.limit < steady / 2
+    for _ in range(500):
+        limit.on_sample(0.01, in_flight=int(limit.limit))
+    assert limit.limit > steady / 2
+
+
+def test_back_off_needs_pressure_and_is_rate_limited():
+    now = [0.0]
+    limiter = ConcurrencyLimiter(initial=32, min_limit=4, max_limit=512, back_off_seconds=1.0, clock=lambda: now[0])
+    telemetry = limiter.limits['telemetry']
+
+    def complete(path, rtt, concurrent=1):
+        name = limiter.classify(path)
+        for _ in range(concurrent):
+            limiter.try_acquire(name)
+        for _ in range(concurrent):
+            limiter.release(name, rtt)
+
+    # Fast scrapes around one slow request: neither is pressure on a protected class.
+    for _ in range(200):
+        complete('/metrics', 0.001)
+    complete('/train/parts', 2.0)
+    for _ in range(20):
+        complete('/admin/profiles', 0.001)
+    complete('/admin/profiles', 2.0)
+    assert limiter.classify('/metrics') == 'metrics'
+    assert telemetry.limit == 32
+
+    # Tickets slowing down while busy backs telemetry off once per interval.
+    for _ in range(50):
+        complete('/tickets', 0.01)
+    complete('/tickets', 0.5, concurrent=30)
+    assert telemetry.limit == pytest.approx(32 * 0.9)
+    now[0] += 1.5
+    complete('/tickets', 0.5, concurrent=30)
+    assert telemetry.limit == pytest.approx(32 * 0.9 * 0.9)
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+import pytest
+from fastapi import Depends, FastAPI
+from httpx import AsyncClient
+from app import models
+from app.profiling import ProfiledRoute, ProfilingMiddleware, capture_file, list_captures, timed
+from app.security import create_access_token
+
+
+def build_app(directory, session_factory, **kwargs):
+    app = FastAPI()
+    app.router.route_class = ProfiledRoute
+
+    def auth():
+        with timed('auth'):
+            return 'tech'
+
+    @app.get('/work')
+    async def work(user: str = Depends(auth)):
+        with timed('feature_prep'):
+            sum(range(10000))
+        with timed('inference'):
+            await asyncio.sleep(0.02)
+        return {'user': user}
+
+    app.add_middleware(ProfilingMiddleware, directory=directory, session_factory=session_factory, **kwargs)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_slow_request_is_captured_with_breakdown(tmp_path, session_factory):
+    app = build_app(str(tmp_path), session_factory, slow_ms=10)
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        assert (await client.get('/work')).json() == {'user': 'tech'}
+
+    [record] = list_captures(str(tmp_path))
+    assert record['path'] == '/work' and record['status'] == 200
+    assert record['profile'] is None
+    breakdown = record['breakdown_ms']
+    assert breakdown['inference'] >= 15
+    assert set(breakdown) == {'auth', 'db', 'feature_prep', 'inference', 'serialization', 'other'}
+    assert sum(breakdown.values()) == pytest.approx(record['duration_ms'], abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_profile_header_requires_admin(tmp_path, session_factory):
+    db = session_factory()
+    db.add_all([
+        models.User(username='prof-admin', hashed_password='x', role='admin'),
+        models.User(username='prof-demoted', hashed_password='x', role='technician'),
+    ])
+    db.commit()
+    db.close()
+    app = build_app(str(tmp_path), session_factory, slow_ms=10000)
+    admin = create_access_token({'sub': 'prof-admin', 'role': 'admin'})
+    # Issued while this user was still an admin.
+    demoted = create_access_token({'sub': 'prof-demoted', 'role': 'admin'})
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        await client.get('/work')
+        await client.get('/work', headers={'X-Profile': '1', 'Authorization': f'Bearer {demoted}'})
+        assert list_captures(str(tmp_path)) == []
+
+        await client.get('/work', headers={'X-Profile': '1', 'Authorization': f'Bearer {admin}'})
+
+    [record] = list_captures(str(tmp_path))
+    path = capture_file(record['id'], 'profile', str(tmp_path))
+    assert os.path.basename(path) == record['profile']
+    with open(path) as f:
+        assert 'speedscope' in json.load(f)['$schema']
+    assert capture_file('../etc', 'record', str(tmp_path)) is None
+
+
+@pytest.mark.asyncio
+async def test_captures_are_pruned(tmp_path, session_factory):
+    app = build_app(str(tmp_path), session_factory, slow_ms=0, max_captures=3)
+    async with AsyncClient(app=app, base_url='http://test') as client:
+        for _ in range(5):
+            await client.get('/work')
+    assert len(list_captures(str(tmp_path))) == 3
+
+
+def test_timed_is_a_no_op_outside_a_request():
+    with timed('db'):
+        pass
@@ -1,6 +1,6 @@
 import pytest
 from httpx import AsyncClient
-from ..main import app
+from app.main import app
 
 @pytest.mark.asyncio
 async def test_telemetry_requires_auth():
@@ -1,6 +1,6 @@
 import pytest
 from httpx import AsyncClient
-from ..main import app
+from app.main import app
 
 @pytest.mark.asyncio
 async def test_ticket_flow():
@@ -13,6 +13,70 @@ async def test_ticket_flow():
         headers = {'Authorization': f'Bearer {token}'}
         # create ticket
         tr = await client.post('/tickets', json={'title':'Test','description':'desc'}, headers=headers)
-        assert tr.status_code == 200
+        assert tr.status_code == 201
         data = tr.json()
-        assert 'ticket_id' in data
\ No newline at end of file
+        assert 'id' in data
+
+def test_list_tickets_keyset_pagination(client, test_user, session_factory):
+    from app import models
+    db = session_factory()
+    for i in range(5):
+        db.add(models.Ticket(title=f'Page {i}', status='open', vehicle_id='VIN-PAGE'))
+    db.add(models.Ticket(title='Other', status='closed', vehicle_id='VIN-PAGE'))
+    db.commit()
+    db.close()
+
+    r = client.post('/auth/token', data={'username': test_user['username'], 'password': test_user['password']})
+    headers = {'Authorization': f"Bearer {r.json()['access_token']}"}
+
+    seen, cursor = [], None
+    while True:
+        params = {'vehicle_id': 'VIN-PAGE', 'status': 'open', 'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        page = client.get('/tickets', params=params, headers=headers)
+        assert page.status_code == 200
+        body = page.json()
+        seen += [t['title'] for t in body['items']]
+        cursor = body['next_cursor']
+        if not cursor:
+            break
+    assert seen == [f'Page {i}' for i in reversed(range(5))]
+
+    bad = client.get('/tickets', params={'cursor': 'not-a-cursor'}, headers=headers)
+    assert bad.status_code == 400
+
+
+def test_ticket_snapshot_window_roundtrip(client, test_user):
+    r = client.post('/auth/token', data={'username': test_user['username'], 'password': test_user['password']})
+    headers = {'Authorization': f"Bearer {r.json()['access_token']}"}
+    samples = [{'time_s': i, 'pack_voltage': 350.0 + i, 'soc': 80.0} for i in range(120)]
+
+    tr = client.post('/tickets', json={'title': 'Voltage drift', 'vehicle_id': 'VIN-SNAP', 'telemetry_snapshot': samples}, headers=headers)
+    assert tr.status_code == 201
+    ticket_id = tr.json()['id']
+    assert 'telemetry_snapshot' not in tr.json()
+
+    listing = client.get('/tickets', params={'vehicle_id': 'VIN-SNAP'}, headers=headers).json()
+    assert 'telemetry_snapshot' not in listing['items'][0]
+
+    snap = client.get(f'/tickets/{ticket_id}/snapshot', headers=headers)
+    assert snap.status_code == 200
+    assert snap.json()['sample_count'] == 120
+    assert snap.json()['samples'] == samples
+
+
+def test_drivers_cannot_read_tickets(client, session_factory):
+    from app import models, security
+    db = session_factory()
+    db.add(models.User(username='driver-tickets', hashed_password=security.get_password_hash('pw'), role='driver'))
+    ticket = models.Ticket(title='Private', status='open', vehicle_id='VIN-PRIVATE')
+    db.add(ticket)
+    db.commit()
+    ticket_id = ticket.id
+    db.close()
+
+    r = client.post('/auth/token', data={'username': 'driver-tickets', 'password': 'pw'})
+    headers = {'Authorization': f"Bearer {r.json()['access_token']}"}
+    assert client.get('/tickets', headers=headers).status_code == 403
+    assert client.get(f'/tickets/{ticket_id}/snapshot', headers=headers).status_code == 403
@@ -0,0 +1,105 @@
+"""
+Synthetic EV fleet fitted to the labelled parts data.
+
+The normal operating profile is a multivariate normal over the telemetry
+signals with a per-signal AR(1) coefficient, so consecutive samples drift
+like real readings (state of charge, for example, is strongly
+autocorrelated). Each fault type in the CSV becomes a mean offset from the
+normal profile. Faults are rare in the data, so their covariance is not
+estimated. Virtual vehicles start fault episodes at random, ramp the offset
+in, and report a matching DTC while the fault lasts.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+SIGNALS = [
+    'pack_voltage', 'pack_current', 'soc', 'soh', 'cell_temp_max', 'cell_temp_min',
+    'coolant_temp', 'motor_rpm', 'motor_torque', 'inverter_temp', 'speed_kph',
+]
+FAULT_DTCS = {
+    'inverter_overheat': 'P0A3C',
+    'battery_degradation': 'P0A7F',
+    'low_pack_voltage': 'P0AFA',
+}
+
+
+@dataclass
+class FleetModel:
+    mean: np.ndarray
+    chol: np.ndarray
+    phi: np.ndarray
+    fault_offsets: Dict[str, np.ndarray]
+    fault_weights: Dict[str, float]
+
+    @classmethod
+    def fit(cls, csv_path: str, label: str = 'fault_type', normal: str = 'normal') -> 'FleetModel':
+        df = pd.read_csv(csv_path)
+        base = df[df[label] == normal][SIGNALS]
+        mean = base.mean().to_numpy()
+        cov = np.cov(base.to_numpy(), rowvar=False) + np.eye(len(SIGNALS)) * 1e-9
+        phi = np.clip(np.nan_to_num(base.apply(lambda s: s.autocorr()).to_numpy()), 0.0, 0.99)
+
+        faults = df[df[label] != normal]
+        offsets = {
+            name: group[SIGNALS].mean().to_numpy() - mean for name, group in faults.groupby(label)
+        }
+        counts = faults[label].value_counts()
+        weights = (counts / counts.sum()).to_dict()
+        return cls(mean=mean, chol=np.linalg.cholesky(cov), phi=phi, fault_offsets=offsets, fault_weights=weights)
+
+
+@dataclass
+class VirtualVehicle:
+    vehicle_id: str
+    model: FleetModel
+    rng: np.random.Generator
+    fault_rate: float = 0.001
+    state: Optional[np.ndarray] = None
+    time_s: int = 0
+    fault: Optional[str] = None
+    fault_left: int = 0
+    fault_age: int = 0
+    faults_injected: List[str] = field(default_factory=list)
+
+    def step(self) -> dict:
+        """Advances one second and returns a /telemetry payload."""
+        m = self.model
+        noise = m.chol @ self.rng.standard_normal(len(SIGNALS))
+        if self.state is None:
+            self.state = m.mean + noise
+        else:
+            self.state = m.mean + m.phi * (self.state - m.mean) + np.sqrt(1 - m.phi ** 2) * noise
+
+        if self.fault is None and m.fault_offsets and self.rng.random() < self.fault_rate:
+            names = list(m.fault_weights)
+            self.fault = str(self.rng.choice(names, p=[m.fault_weights[n] for n in names]))
+            self.fault_left = int(self.rng.integers(30, 300))
+            self.fault_age = 0
+            self.faults_injected.append(self.fault)
+
+        values = self.state
+        dtc_codes = []
+        if self.fault is not None:
+            self.fault_age += 1
+            ramp = min(1.0, self.fault_age / 10)
+            values = values + ramp * m.fault_offsets[self.fault]
+            dtc_codes.append(FAULT_DTCS.get(self.fault, 'P0000'))
+            self.fault_left -= 1
+            if self.fault_left <= 0:
+                self.fault = None
+
+        payload = dict(zip(SIGNALS, (round(float(v), 3) for v in values)))
+        payload.update(vehicle_id=self.vehicle_id, time_s=self.time_s, dtc_codes=dtc_codes)
+        self.time_s += 1
+        return payload
+
+
+def build_fleet(model: FleetModel, n: int, fault_rate: float = 0.001, seed: int = 0) -> List[VirtualVehicle]:
+    rng = np.random.default_rng(seed)
+    return [
+        VirtualVehicle(f'SIM-{i:05d}', model, np.random.default_rng(rng.integers(1 << 32)), fault_rate)
+        for i in range(n)
+    ]
@@ -0,0 +1,74 @@
+"""
+Compares the per-call /telemetry inference path with InferenceBatcher.
+
+Trains an IsolationForest on the bundled parts CSV, then runs N concurrent
+simulated requests per scenario against both paths and prints throughput and
+latency percentiles. The per-call path never yields, so its latencies leave
+out the time other requests spend queued behind it on the event loop;
+compare throughput first. Run from backend/:
+
+    python -m benchmarks.inference_batching --requests 2000
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from app.inference_batcher import InferenceBatcher
+from app.model import AnomalyModel, prepare_features_single
+
+
+def build_model(csv_path):
+    df = pd.read_csv(csv_path)
+    X = np.vstack([prepare_features_single(r) for r in df.to_dict('records')])
+    model = AnomalyModel()
+    model.model = IsolationForest(n_estimators=100, random_state=42).fit(X)
+    return model, X
+
+
+async def per_call(model, feat):
+    # Mirrors the previous endpoint: two sklearn calls on a 1x44 array, on the event loop.
+    x = feat.reshape(1, -1)
+    return model.score(x)[0], model.predict(x)[0]
+
+
+async def run(scenario, concurrency, total, X):
+    latencies = []
+    per_client = total // concurrency
+
+    async def client(i):
+        for j in range(per_client):
+            feat = X[(i * per_client + j) % len(X)]
+            start = time.perf_counter()
+            await scenario(feat)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+async def main(args):
+    model, X = build_model(args.csv)
+    print(f"{'path':<10}{'clients':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for concurrency in args.concurrency:
+        batcher = InferenceBatcher(model, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+        for name, scenario in (('per-call', lambda f: per_call(model, f)), ('batched', batcher.submit)):
+            rps, p50, p99 = await run(scenario, concurrency, args.requests, X)
+            print(f"{name:<10}{concurrency:>8}{rps:>10.0f}{p50:>9.2f}{p99:>9.2f}")
+        print(f"{'':<10}mean batch size {batcher.rows / max(batcher.batches, 1):.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', default='app/data/parts_labeled.csv')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64, 256])
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
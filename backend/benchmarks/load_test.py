@@ -0,0 +1,258 @@
+"""
+End-to-end load generator driven by the synthetic fleet.
+
+Sends open-loop traffic at fixed target rates: telemetry from N virtual
+vehicles, dashboard ticket listings, occasional ticket creation and token
+requests. It can also hold websocket clients on /ws/stream. Latency is
+measured from each request's scheduled send time, so a server that falls
+behind shows it in the percentiles instead of quietly lowering the offered
+rate. Prints throughput, latency percentiles and error rates per route,
+and can write them as JSON for comparing runs.
+
+Against a server you started yourself:
+
+    python -m benchmarks.load_test --base-url http://localhost:8000 --vehicles 500 --rate 200
+
+Fully offline: --spawn starts uvicorn on a throwaway SQLite database, with
+an IsolationForest fitted to the parts CSV so inference runs too:
+
+    python -m benchmarks.load_test --spawn --duration 30 --rate 300
+
+Use --database-url to point the spawned server at a local Postgres instead.
+Websocket clients need the optional `websockets` package.
+
+Without --username a fresh user is registered for the run; registration is
+rate limited (5/minute per IP), so for repeated runs against one server pass
+an existing account with --username/--password. Rate-limited responses
+(429) are reported separately from errors.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+import numpy as np
+
+from .fleet_simulator import FleetModel, build_fleet
+
+CSV_PATH = 'app/data/parts_labeled.csv'
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, route, scheduled, status):
+        self.latencies[route].append(time.perf_counter() - scheduled)
+        self.statuses[route][status] += 1
+
+    def report(self, elapsed):
+        rows = {}
+        for route in sorted(self.latencies):
+            ms = np.array(self.latencies[route]) * 1000
+            statuses = self.statuses[route]
+            total = sum(statuses.values())
+            rate_limited = statuses.get(429, 0)
+            errors = sum(n for s, n in statuses.items() if not (isinstance(s, int) and s < 400)) - rate_limited
+            rows[route] = {
+                'requests': total,
+                'throughput': total / elapsed,
+                'p50_ms': float(np.percentile(ms, 50)),
+                'p90_ms': float(np.percentile(ms, 90)),
+                'p99_ms': float(np.percentile(ms, 99)),
+                'max_ms': float(ms.max()),
+                'error_rate': errors / total,
+                'rate_limited_rate': rate_limited / total,
+                'statuses': {str(s): n for s, n in statuses.items()},
+            }
+        return rows
+
+
+async def paced(rate, duration, limit, fn):
+    """Calls `fn(scheduled_time)` `rate` times a second without waiting for responses."""
+    if rate <= 0:
+        return
+    start = time.perf_counter()
+    tasks = set()
+    for i in range(int(rate * duration)):
+        scheduled = start + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        async def one(scheduled=scheduled):
+            async with limit:
+                await fn(scheduled)
+        task = asyncio.create_task(one())
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+
+
+async def send(recorder, route, scheduled, request):
+    try:
+        r = await request
+        recorder.record(route, scheduled, r.status_code)
+    except httpx.HTTPError as e:
+        recorder.record(route, scheduled, type(e).__name__)
+
+
+async def login(client, username, password, register):
+    if register:
+        r = await client.post('/auth/register', json={'username': username, 'password': password, 'role': 'technician'})
+        if r.status_code == 429:
+            raise SystemExit('Registration is rate limited; rerun with --username/--password of an existing user')
+        r.raise_for_status()
+    r = await client.post('/auth/token', data={'username': username, 'password': password})
+    if r.status_code == 429:
+        raise SystemExit('Token endpoint is rate limited; wait a minute or lower --auth-rate')
+    r.raise_for_status()
+    return r.json()['access_token']
+
+
+async def ws_client(base_url, token, duration, interval, recorder):
+    import websockets
+
+    url = base_url.replace('http', 'ws', 1) + f'/ws/stream?token={token}'
+    deadline = time.perf_counter() + duration
+    try:
+        async with websockets.connect(url) as ws:
+            while time.perf_counter() < deadline:
+                scheduled = time.perf_counter()
+                await ws.send('ping')
+                await ws.recv()
+                recorder.record('WS /ws/stream', scheduled, 200)
+                await asyncio.sleep(interval)
+    except Exception as e:
+        recorder.record('WS /ws/stream', time.perf_counter(), type(e).__name__)
+
+
+async def run(args):
+    fleet = build_fleet(FleetModel.fit(args.csv), args.vehicles, args.fault_rate, args.seed)
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        register = args.username is None
+        username = args.username or f'loadtest-{uuid.uuid4().hex[:8]}'
+        password = args.password or uuid.uuid4().hex
+        token = await login(client, username, password, register)
+        headers = {'Authorization': f'Bearer {token}'}
+        limit = asyncio.Semaphore(args.max_in_flight)
+        cursor = {'i': 0}
+
+        async def telemetry(scheduled):
+            vehicle = fleet[cursor['i'] % len(fleet)]
+            cursor['i'] += 1
+            await send(recorder, 'POST /telemetry', scheduled, client.post('/telemetry', json=vehicle.step(), headers=headers))
+
+        async def list_tickets(scheduled):
+            await send(recorder, 'GET /tickets', scheduled, client.get('/tickets', params={'limit': 50}, headers=headers))
+
+        async def create_ticket(scheduled):
+            vehicle = fleet[int(np.random.randint(len(fleet)))]
+            body = {'title': 'Load test ticket', 'vehicle_id': vehicle.vehicle_id, 'telemetry_snapshot': vehicle.step()}
+            await send(recorder, 'POST /tickets', scheduled, client.post('/tickets', json=body, headers=headers))
+
+        async def token_request(scheduled):
+            await send(recorder, 'POST /auth/token', scheduled,
+                       client.post('/auth/token', data={'username': username, 'password': password}))
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            paced(args.rate, args.duration, limit, telemetry),
+            paced(args.tickets_rate, args.duration, limit, list_tickets),
+            paced(args.ticket_create_rate, args.duration, limit, create_ticket),
+            paced(args.auth_rate, args.duration, limit, token_request),
+            *(ws_client(args.base_url, token, args.duration, args.ws_interval, recorder) for _ in range(args.ws_clients)),
+        )
+        elapsed = time.perf_counter() - start
+
+    rows = recorder.report(elapsed)
+    print(f"{'route':<18}{'reqs':>8}{'req/s':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'err%':>7}{'429%':>7}  statuses")
+    for route, r in rows.items():
+        print(f"{route:<18}{r['requests']:>8}{r['throughput']:>9.1f}{r['p50_ms']:>9.1f}{r['p90_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}{r['error_rate'] * 100:>7.2f}"
+              f"{r['rate_limited_rate'] * 100:>7.2f}  {r['statuses']}")
+    injected = Counter(f for v in fleet for f in v.faults_injected)
+    print(f"faults injected: {dict(injected) or 'none'}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'routes': rows, 'faults_injected': injected}, f, indent=2)
+
+
+def spawn_server(args, workdir):
+    """Starts uvicorn on a throwaway database with a freshly fitted anomaly model."""
+    import joblib
+    from sklearn.ensemble import IsolationForest
+    from app.model import prepare_features_single
+    import pandas as pd
+
+    models_dir = os.path.join(workdir, 'models')
+    os.makedirs(models_dir)
+    X = np.vstack([prepare_features_single(r) for r in pd.read_csv(args.csv).to_dict('records')])
+    joblib.dump(IsolationForest(n_estimators=100, random_state=0).fit(X), os.path.join(models_dir, 'model_iforest.joblib'))
+
+    env = dict(os.environ, MODELS_DIR=models_dir,
+               DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}")
+    port = args.base_url.rsplit(':', 1)[-1].strip('/')
+    proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', port, '--log-level', 'warning'],
+                            env=env, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            if httpx.get(args.base_url + '/health').status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('Spawned server did not become healthy')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--spawn', action='store_true', help='start a local uvicorn server for the run')
+    parser.add_argument('--database-url', help='database for --spawn (default: temporary SQLite file)')
+    parser.add_argument('--username', help='existing user to log in as (default: register a fresh one)')
+    parser.add_argument('--password', help='password for --username')
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--vehicles', type=int, default=100)
+    parser.add_argument('--fault-rate', type=float, default=0.001, help='chance per vehicle-second of starting a fault')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds')
+    parser.add_argument('--rate', type=float, default=100.0, help='telemetry requests per second')
+    parser.add_argument('--tickets-rate', type=float, default=2.0, help='GET /tickets per second')
+    parser.add_argument('--ticket-create-rate', type=float, default=0.2, help='POST /tickets per second')
+    parser.add_argument('--auth-rate', type=float, default=0.1,
+                        help='POST /auth/token per second (the server allows 10/minute per IP)')
+    parser.add_argument('--ws-clients', type=int, default=0)
+    parser.add_argument('--ws-interval', type=float, default=1.0)
+    parser.add_argument('--max-in-flight', type=int, default=256)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args()
+    if args.username and not args.password:
+        parser.error('--username needs --password')
+
+    if not args.spawn:
+        asyncio.run(run(args))
+        return
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = spawn_server(args, workdir)
+        try:
+            asyncio.run(run(args))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,7 @@ from app.config import settings
 
 config = context.config
 
-database_url = os.getenv("DATABASE_URL", "sqlite:///app.db")
+database_url = os.getenv("DATABASE_URL", settings.DATABASE_URL)
 config.set_main_option("sqlalchemy.url", database_url)
 
 if config.config_file_name is not None:
@@ -0,0 +1,35 @@
+"""ticket listing indexes
+
+Revision ID: 0001_ticket_list_indexes
+Revises:
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+
+
+revision = '0001_ticket_list_indexes'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_tickets_created_at_id', ['created_at', 'id']),
+    ('ix_tickets_status_created_at_id', ['status', 'created_at', 'id']),
+    ('ix_tickets_assigned_to_status_created_at_id', ['assigned_to', 'status', 'created_at', 'id']),
+    ('ix_tickets_vehicle_id_created_at_id', ['vehicle_id', 'created_at', 'id']),
+]
+
+
+def upgrade():
+    # Build concurrently on Postgres so ticket inserts are not blocked
+    # while the indexes are created on a populated table.
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(name, 'tickets', columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _ in INDEXES:
+            op.drop_index(name, table_name='tickets', postgresql_concurrently=True)
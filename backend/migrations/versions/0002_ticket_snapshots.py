@@ -0,0 +1,72 @@
+"""move ticket telemetry snapshots to compressed side table
+
+Revision ID: 0002_ticket_snapshots
+Revises: 0001_ticket_list_indexes
+Create Date: 2026-10-19
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.snapshots import compress_samples, decompress_samples
+
+
+revision = '0002_ticket_snapshots'
+down_revision = '0001_ticket_list_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    # The app's startup create_all() may already have created the table on a
+    # database that had not been migrated yet.
+    if sa.inspect(conn).has_table('ticket_snapshots'):
+        snapshots = sa.table(
+            'ticket_snapshots',
+            sa.column('ticket_id', sa.Integer()),
+            sa.column('sample_count', sa.Integer()),
+            sa.column('data', sa.LargeBinary()),
+        )
+    else:
+        snapshots = op.create_table(
+            'ticket_snapshots',
+            sa.Column('ticket_id', sa.Integer(), sa.ForeignKey('tickets.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('sample_count', sa.Integer(), nullable=False),
+            sa.Column('data', sa.LargeBinary(), nullable=False),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+
+    rows = conn.execute(sa.text('SELECT id, telemetry_snapshot FROM tickets WHERE telemetry_snapshot IS NOT NULL'))
+    migrated = []
+    for ticket_id, text in rows:
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = {'raw': text}
+        samples = value if isinstance(value, list) else [value]
+        migrated.append({'ticket_id': ticket_id, 'sample_count': len(samples), 'data': compress_samples(samples)})
+    if migrated:
+        op.bulk_insert(snapshots, migrated)
+
+    with op.batch_alter_table('tickets') as batch:
+        batch.drop_column('telemetry_snapshot')
+
+
+def downgrade():
+    with op.batch_alter_table('tickets') as batch:
+        batch.add_column(sa.Column('telemetry_snapshot', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.text('SELECT ticket_id, data FROM ticket_snapshots')).fetchall()
+    for ticket_id, data in rows:
+        samples = decompress_samples(data)
+        # Tickets created before 0002 held a single JSON object.
+        value = samples[0] if len(samples) == 1 else samples
+        conn.execute(
+            sa.text('UPDATE tickets SET telemetry_snapshot = :value WHERE id = :id'),
+            {'value': json.dumps(value, default=str), 'id': ticket_id},
+        )
+    op.drop_table('ticket_snapshots')
@@ -0,0 +1,31 @@
+"""auto-ticketing columns on tickets
+
+Revision ID: 0003_auto_ticket_columns
+Revises: 0002_ticket_snapshots
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0003_auto_ticket_columns'
+down_revision = '0002_ticket_snapshots'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tickets') as batch:
+        batch.add_column(sa.Column('source', sa.String(), server_default='manual', nullable=False))
+        batch.add_column(sa.Column('anomaly_count', sa.Integer(), server_default='0', nullable=False))
+        batch.add_column(sa.Column('anomaly_score', sa.Float(), nullable=True))
+        batch.add_column(sa.Column('last_anomaly_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('tickets') as batch:
+        batch.drop_column('last_anomaly_at')
+        batch.drop_column('anomaly_score')
+        batch.drop_column('anomaly_count')
+        batch.drop_column('source')
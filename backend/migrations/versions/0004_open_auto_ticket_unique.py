@@ -0,0 +1,38 @@
+"""one open auto ticket per vehicle
+
+Revision ID: 0004_open_auto_ticket_unique
+Revises: 0003_auto_ticket_columns
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004_open_auto_ticket_unique'
+down_revision = '0003_auto_ticket_columns'
+branch_labels = None
+depends_on = None
+
+OPEN_AUTO = "source = 'auto' AND status = 'open'"
+
+
+def upgrade():
+    # Workers raced each other before this constraint existed; close all but
+    # the newest open auto ticket per vehicle so the index can be built.
+    op.execute(sa.text(f"""
+        UPDATE tickets SET status = 'closed'
+        WHERE {OPEN_AUTO} AND id NOT IN (
+            SELECT MAX(id) FROM tickets WHERE {OPEN_AUTO} GROUP BY COALESCE(vehicle_id, '')
+        )
+    """))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ux_tickets_open_auto_vehicle', 'tickets', [sa.text("COALESCE(vehicle_id, '')")], unique=True,
+            postgresql_where=sa.text(OPEN_AUTO), sqlite_where=sa.text(OPEN_AUTO), postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ux_tickets_open_auto_vehicle', table_name='tickets', postgresql_concurrently=True)